@@ -0,0 +1,131 @@
+import multiprocessing
+import queue
+import threading
+import atexit
+
+from EEGSampler import EEGSampler, DEFAULT_FS, DEFAULT_SECONDS, DEFAULT_CHANNELS
+from SamplerMemory import SamplerMemory
+
+LATENCY_STATS_TIMEOUT_SECONDS = 1 # How long getLatencyStats waits for the acquisition process to answer
+
+
+def run_acquisition(memory_name, sampler_kwargs, commands, replies):
+    '''
+        Entry point of the acquisition process: streams into the shared memory until told to end
+    '''
+    memory = SamplerMemory(sampler_kwargs['fs'] * sampler_kwargs['buffer_seconds'], len(sampler_kwargs['channels']), name=memory_name)
+    eeg_sampler = EEGSampler(memory=memory, **sampler_kwargs)
+    eeg_sampler.startStream()
+    while True:
+        command, argument = commands.get()
+        if command == 'model':
+            eeg_sampler.setModel(argument)
+        elif command == 'smoothing':
+            eeg_sampler.setSmoothingKernel(argument)
+        elif command == 'stats':
+            replies.put((argument, eeg_sampler.getLatencyStats()))
+        elif command == 'end':
+            break
+    eeg_sampler.end()
+
+
+class AcquisitionProcess:
+    """ Runs an EEGSampler, acquisition and inference, in a separate process.
+
+        The sampler writes into a multiprocessing.shared_memory block that this process attaches to
+        read-only, so plotting and the Tk event loop can never hold up sample handling. It offers the
+        same stream control and buffer get methods as EEGSampler, so the GUI can use either.
+    """
+    def __init__(self, live, fs=DEFAULT_FS, buffer_seconds=DEFAULT_SECONDS, channels=DEFAULT_CHANNELS, model=None, **sampler_kwargs):
+        self.sampler_kwargs = dict(sampler_kwargs, live=live, fs=fs, buffer_seconds=buffer_seconds, channels=channels)
+        self.model = model
+        self.smoothing_kernel = None
+        self.memory = SamplerMemory(fs * buffer_seconds, len(channels), shared=True, read_only=True)
+        self.started = False
+        self.stats_lock = threading.Lock()
+        self.stats_request = 0
+        atexit.register(self.close)
+
+    ############################
+    ## STREAM CONTROL METHODS ##
+    ############################
+    def setModel(self, model):
+        '''
+            Allows for the model to be updated, it is sent to the acquisition process if running
+        '''
+        self.model = model
+        if self.started:
+            self.commands.put(('model', model))
+
+    def setSmoothingKernel(self, kernel):
+        self.smoothing_kernel = kernel
+        if self.started:
+            self.commands.put(('smoothing', kernel))
+
+    def startStream(self):
+        print("start acquisition process called")
+        if not self.started:
+            self.started = True
+            self.commands = multiprocessing.Queue()
+            self.replies = multiprocessing.Queue()
+            if self.model is not None:
+                self.commands.put(('model', self.model))
+            if self.smoothing_kernel is not None:
+                self.commands.put(('smoothing', self.smoothing_kernel))
+            self.process = multiprocessing.Process(target=run_acquisition, args=(self.memory.name, self.sampler_kwargs, self.commands, self.replies))
+            self.process.start()
+
+    def end(self):
+        print("end acquisition process called")
+        if self.started:
+            self.started = False
+            self.commands.put(('end', None))
+            self.process.join()
+
+    def close(self):
+        self.end()
+        self.memory.close()
+
+    def getLatencyStats(self, timeout=LATENCY_STATS_TIMEOUT_SECONDS):
+        '''
+            Latency stats of the sampler in the acquisition process (see EEGSampler.getLatencyStats),
+            or None if it isn't running or doesn't answer within timeout seconds
+        '''
+        if not self.started:
+            return None
+        with self.stats_lock:
+            # Requests are numbered so a late answer to a request that timed out is never returned
+            self.stats_request += 1
+            self.commands.put(('stats', self.stats_request))
+            while True:
+                try:
+                    request, stats = self.replies.get(timeout=timeout)
+                except queue.Empty:
+                    return None
+                if request == self.stats_request:
+                    return stats
+
+    ########################
+    ## BUFFER GET METHODS ##
+    ########################
+
+    # All buffers are read-only views ordered newest first
+    def getBuffer(self):
+        return self.memory.buffer.getLatest()
+
+    def getPredictionValue(self):
+        return self.memory.prediction
+    def getPredictionValues(self):
+        return self.memory.pred_values.getLatest()
+    def getPredictionIndex(self):
+        return self.memory.prediction_index
+    def getPredictionTime(self):
+        return self.memory.prediction_time
+
+    def getPredictionValueAverage(self):
+        return self.memory.prediction_average
+    def getPredictionValueAverages(self):
+        return self.memory.pred_values_average.getLatest()
+
+    def getSnapshot(self, n_samples=None):
+        return self.memory.getSnapshot(n_samples)
@@ -0,0 +1,32 @@
+import numpy as np
+from scipy.signal import lfilter
+
+
+class DCEstimator:
+    """ Streaming estimate of the DC offset of every channel as an exponential moving average.
+
+        Blocks of samples are processed with a single lfilter call along the time axis, so the
+        estimate is exact per sample while staying vectorized across samples and channels.
+    """
+    def __init__(self, n_chans, fs=250, time_constant=1):
+        self.alpha = 1 - np.exp(-1 / (time_constant * fs))
+        self.mean = np.zeros(n_chans)
+        self.initialized = False
+
+    def process(self, samples):
+        '''
+            Update the estimate with a block shaped (#samples, #chans) ordered oldest first and
+            return the block with the running DC offset removed
+        '''
+        if not self.initialized:
+            # Start from the first sample so the offset is removed right away instead of being learned
+            self.mean = np.array(samples[0], dtype=float)
+            self.initialized = True
+        # mean[n] = alpha * x[n] + (1 - alpha) * mean[n-1]
+        means, zf = lfilter([self.alpha], [1, self.alpha - 1], samples, axis=0, zi=(1 - self.alpha) * self.mean[np.newaxis, :])
+        self.mean = means[-1]
+        return samples - means
+
+    def reset(self):
+        self.mean[:] = 0
+        self.initialized = False
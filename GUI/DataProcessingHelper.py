@@ -1,92 +1,126 @@
 import pandas as pd
 import numpy as np
-from neurodsp import filt
+from neurodsp.filt.fir import design_fir_filter
 import random
 import matplotlib.pyplot as plt
 import scipy.signal as signal # For filtering
 from neurodsp.spectral import compute_spectrum # for smoothed PSD computation
 import pyeeg
+from functools import lru_cache
+from EpochSet import EpochSet
 
 
+FILTER_CACHE_SIZE = 32 # Number of filter designs kept, least recently used designs are dropped first
+
+# Design a filter once per set of parameters: a butterworth sos for 'iir' or FIR coefficients for 'fir'
+def getFilterDesign(fs, band, order=2, filter_type='iir', pass_type='bandpass', n_seconds=None):
+    return _designFilter(fs, tuple(band), order, filter_type, pass_type, n_seconds)
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _designFilter(fs, band, order, filter_type, pass_type, n_seconds):
+    if filter_type == 'iir':
+        design = signal.butter(order, band, btype=pass_type, output='sos', fs=fs)
+    else :
+        design = design_fir_filter(fs, pass_type, band, n_seconds=n_seconds)
+    return design # Shared by every caller, so it must not be modified
+
+# Zero-phase FIR bandstop (1 second long by default) that keeps the shape of sig, the edges are filtered as if sig was zero padded
+# Gives the same attenuation as filt.filter_signal(sig, fs, 'bandstop', band, n_seconds=1) without its NaN edges
+def notchFilter(sig, fs=250, band=(58, 62), n_seconds=1, axis=-1):
+    sig = np.asarray(sig)
+    kernel = getFilterDesign(fs, band, filter_type='fir', pass_type='bandstop', n_seconds=n_seconds)
+    # Lay the kernel along the time axis so every other axis is filtered in the same call
+    kernel_shape = [1] * sig.ndim
+    kernel_shape[axis] = len(kernel)
+    return signal.convolve(sig, kernel.reshape(kernel_shape), mode='same')
+
 # Filter eeg // does perform well on short signals, possibly because of padding
-def filterEEG(eeg_data, fs=250, f_range=(1, 50)):
-    sig_filt = filt.filter_signal(eeg_data, fs, 'bandpass', f_range, filter_type='iir', butterworth_order=2)
-    test_sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
-    num_nans = sum(np.isnan(test_sig_filt))
-    sig_filt = np.concatenate(([0]*(num_nans // 2), sig_filt, [0]*(num_nans // 2)))
-    sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
-    sig_filt = sig_filt[~np.isnan(sig_filt)]
-    return sig_filt
-
-from scipy.signal import butter, sosfiltfilt, sosfreqz  # for filtering
-def bandpass_bandstop_filter(data,fs=250, lowcut=1, highcut=50, order = 2):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    sos = butter(order, [low, high], analog = False, btype = 'band', output = 'sos')
-    filted_data = sosfiltfilt(sos, data)
-    filted_data = filt.filter_signal(filted_data, fs, 'bandstop', (58, 62), n_seconds=1)
-    filted_data = filted_data[~np.isnan(filted_data)]
-    return filted_data
+# eeg_data can have any number of dimensions, e.g. (#channels, #timepoints) with axis=-1 or (#timepoints, #channels) with axis=0
+def filterEEG(eeg_data, fs=250, f_range=(1, 50), axis=-1):
+    sig_filt = signal.sosfiltfilt(getFilterDesign(fs, f_range), eeg_data, axis=axis)
+    return notchFilter(sig_filt, fs, axis=axis)
+
+from scipy.signal import sosfiltfilt  # for filtering
+def bandpass_bandstop_filter(data,fs=250, lowcut=1, highcut=50, order = 2, axis=-1):
+    sos = getFilterDesign(fs, (lowcut, highcut), order)
+    filted_data = sosfiltfilt(sos, data, axis=axis)
+    return notchFilter(filted_data, fs, axis=axis)
 
 # Filter a whole set of eeg epochs 
 def getFilteredEpochs(eeg_epochs):
-    # eeg_epochs is in (#trials, #timepoints, #channels)
-    filtered_eeg_epochs = []
-    for eeg_epoch in eeg_epochs: 
-        filtered_epoch = []
-        for i in range(len(eeg_epoch)):  
-            filtered_eeg = bandpass_bandstop_filter(eeg_epoch[i])
-            filtered_epoch.append(filtered_eeg)
-        filtered_epoch = np.array(filtered_epoch)
-        filtered_eeg_epochs.append(filtered_epoch)
-    return np.array(filtered_eeg_epochs)
+    # eeg_epochs is in (#trials, #channels, #timepoints), all of them are filtered along time at once
+    return bandpass_bandstop_filter(np.asarray(eeg_epochs), axis=-1)
 
 def getOutputLabelsAndEpochTimes(event_df):
     # Generates the ordered list of output labels and epoch time pairs
-    # Input: event_df -- the event dataframe from the csv file
+    # Input: event_df -- the event dataframe from the csv file, with alternating start_<label> and end_<label> events
     # Output: 
     #    output_labels -- [1, 2, 4, 3, etc] where the integers correspond to the trial type encoded
     #    epoch_times -- [[<timestamp of start>, <timestamp of end>], [<timestamp of start>, <timestamp of end>], etc]
-    
-    output_labels = []
-    epoch_times = []
-    current_epoch = []
-    for index, row in event_df.iterrows():
-        event_info = row['EventStart'].split("_")
-        if event_info[0] == 'start': 
-            output_labels.append(int(event_info[1]))
-            current_epoch.append(row['time'])
-        else :
-            current_epoch.append(row['time'])
-            epoch_times.append(list(current_epoch))
-            current_epoch = []
-    return np.array(output_labels), np.array(epoch_times)
-
-def getEEGEpochs(epoch_times, eeg_df, eeg_chans, target_num_trials=1000):
+    # Raises a ValueError for unmatched start and end events, a trial still going when the recording stopped is left out
+    events = event_df['EventStart'].astype(str).str.split("_", n=1, expand=True).reindex(columns=[0, 1])
+    kinds = events[0].values
+    labels = events[1].values
+    times = event_df['time'].values
+
+    if len(kinds) % 2 == 1 and kinds[-1] == 'start':
+        print("Warning: Leaving out the last trial, its start has no end")
+        kinds, labels, times = kinds[:-1], labels[:-1], times[:-1]
+    expected_kinds = np.tile(['start', 'end'], len(kinds) // 2 + 1)[:len(kinds)]
+    unmatched = np.flatnonzero(kinds != expected_kinds)
+    if len(unmatched) > 0 or len(kinds) % 2 == 1:
+        index = unmatched[0] if len(unmatched) > 0 else len(kinds) - 1
+        raise ValueError("Unmatched event " + str(event_df['EventStart'].values[index]) + " at row " + str(index))
+    mismatched = np.flatnonzero(labels[0::2] != labels[1::2])
+    if len(mismatched) > 0:
+        index = 2 * mismatched[0]
+        raise ValueError("Event " + str(event_df['EventStart'].values[index + 1]) + " at row " + str(index + 1) + " ends a trial started by " + str(event_df['EventStart'].values[index]))
+
+    output_labels = labels[0::2].astype(int)
+    epoch_times = np.stack((times[0::2], times[1::2]), axis=1).astype(float)
+    return output_labels, epoch_times
+
+def getEEGEpochs(epoch_times, eeg_df, eeg_chans, target_num_trials=1000, baseline_seconds=1.5, return_kept=False):
     # Slices and generates the epochs in the eeg_df given the epoch_times
     # Input: 
     #    epoch_times: [[<timestamp of start>, <timestamp of end>], [<timestamp of start>, <timestamp of end>], etc]
-    #    eeg_df: dataframe from csv file
+    #    eeg_df: dataframe from csv file, sorted by its 'time' column
     # Output: 
-    #    a numpy array containing eeg_epochs (#epoch, #chans, #timepoints)
-    eeg_epochs = []
-    for epoch_time in epoch_times: 
-        baseline_df = eeg_df[(eeg_df['time'] > (epoch_time[0] - 1.5)) & (eeg_df['time'] < ((epoch_time[0])))]
-        baseline_df = baseline_df.drop(columns=['time'])
-        baselines = np.mean(baseline_df[eeg_chans].values, 0)
-        sub_df = eeg_df[(eeg_df['time'] > epoch_time[0]) & (eeg_df['time'] < epoch_time[1])]
-        sub_df = sub_df.drop(columns=['time'])
-        sub_df = sub_df - baselines
-        num_above = len(sub_df) - target_num_trials
-        if num_above >= 0:
-            epoch = np.array(sub_df.values[num_above // 2: len(sub_df) - num_above // 2])[:1000]
-            eeg_epochs.append(epoch.T)
-            if len(epoch) != 1000:
-                print("Warning: Potential off by 1 error. Found trail with != 1000 samples:", len(epoch))
-        else: 
-            print("Warning: Epoch with less than", target_num_trials, "eeg samples")
-    return np.array(eeg_epochs)
+    #    a numpy array containing eeg_epochs (#epoch, #chans, #timepoints), where each epoch is the middle target_num_trials
+    #    samples of its trial minus the mean of the baseline_seconds before the trial
+    #    and with return_kept, also the boolean mask of the epoch_times whose trials were long enough to keep
+    epoch_times = np.asarray(epoch_times, dtype=float).reshape(-1, 2)
+    times = eeg_df['time'].values
+    data = eeg_df[eeg_chans].values
+
+    # Bounds of every baseline and trial, both exclusive of their start and end times
+    baseline_starts = np.searchsorted(times, epoch_times[:, 0] - baseline_seconds, side='right')
+    trial_starts = np.searchsorted(times, epoch_times[:, 0], side='right')
+    trial_ends = np.searchsorted(times, epoch_times[:, 1], side='left')
+    baseline_ends = np.searchsorted(times, epoch_times[:, 0], side='left')
+
+    # Baseline means from the running sum of the samples
+    sums = np.concatenate((np.zeros((1, data.shape[1])), np.cumsum(data, 0)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        baselines = (sums[baseline_ends] - sums[baseline_starts]) / (baseline_ends - baseline_starts)[:, np.newaxis]
+
+    num_above = trial_ends - trial_starts - target_num_trials
+    for i in np.flatnonzero(num_above < 0):
+        print("Warning: Epoch with less than", target_num_trials, "eeg samples")
+    keep = num_above >= 0
+
+    # Gather the middle of every long enough trial at once and remove its baseline
+    epoch_indices = (trial_starts + num_above // 2)[keep, np.newaxis] + np.arange(target_num_trials)
+    eeg_epochs = np.empty((len(epoch_indices), len(eeg_chans), target_num_trials))
+    np.subtract(data.T[:, epoch_indices].transpose(1, 0, 2), baselines[keep, :, np.newaxis], out=eeg_epochs)
+    if return_kept:
+        return eeg_epochs, keep
+    return eeg_epochs
+
+def getEpochSet(epoch_times, output_labels, eeg_df, eeg_chans, target_num_trials=1000):
+    # EpochSet of the epochs of getEEGEpochs, with the labels and start times of the trials that were kept
+    eeg_epochs, keep = getEEGEpochs(epoch_times, eeg_df, eeg_chans, target_num_trials, return_kept=True)
+    return EpochSet(eeg_epochs, np.asarray(output_labels)[keep], np.asarray(epoch_times, dtype=float).reshape(-1, 2)[keep, 0], eeg_chans)
 
 ## Create DF for each of these, columns are channels, each row is a trial run
 def getDF(epochs, labels, times, chans):
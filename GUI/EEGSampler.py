@@ -7,14 +7,25 @@ import threading
 import random
 
 from PowerBinModel import PowerBinModel
-from DataProcessingHelper import filterEEG
+from SpectralFeatures import SlidingSpectrum
+from RingBuffer import RingBuffer
+from SamplerMemory import SamplerMemory
+from StreamingFilter import StreamingFilter
+from DCEstimator import DCEstimator
+from InferenceWorker import InferenceWorker, DROP_OLDEST
+from LatencyMonitor import latency_monitor
+from collections import deque
+from PredictionSmoother import PredictionSmoother, BOXCAR
 import atexit
 
 
 SCALE_FACTOR_EEG = (4500000)/24/(2**23-1) # uV/count
 
 DEFAULT_PREDICTION_WINDOW_SECONDS = 4 # Window in seconds needed for prediction
-DEFAULT_UPDATE_SECONDS = 0.5 # Number of seconds to wait before updating prediction values
+DEFAULT_UPDATE_SECONDS = 0.5 # Number of seconds of samples between prediction updates
+PREDICTION_HISTORY_LENGTH = 10000 # Number of (sample index, prediction) pairs kept for getPredictionHistory()
+EVENT_HISTORY_LENGTH = 1000 # Number of (sample index, event) pairs kept for getEventHistory()
+DEFAULT_TIMEPOINTS_TO_CHOP = 50 # The streaming filter is causal and the DC offset is tracked, so only a short settle is skipped
 
 DEFAULT_SECONDS = 10 # 10 second long buffer 
 DEFAULT_FS = 250
@@ -23,36 +34,53 @@ DEFAULT_CHANNELS = [0, 1, 2, 3, 4, 5, 6, 7] # These are all the Cyton channels
 class EEGSampler:
     """ Holds a buffer of EEG data and accepts a single data sample as input to append to the buffer
     """
-    def __init__(self, live, fs=DEFAULT_FS, buffer_seconds=DEFAULT_SECONDS, update_seconds=DEFAULT_UPDATE_SECONDS, prediction_seconds=DEFAULT_PREDICTION_WINDOW_SECONDS, channels=DEFAULT_CHANNELS, model=None, to_clean=True):
+    def __init__(self, live, fs=DEFAULT_FS, buffer_seconds=DEFAULT_SECONDS, update_seconds=DEFAULT_UPDATE_SECONDS, prediction_seconds=DEFAULT_PREDICTION_WINDOW_SECONDS, channels=DEFAULT_CHANNELS, model=None, to_clean=True, timepoints_to_chop=DEFAULT_TIMEPOINTS_TO_CHOP, overload_policy=DROP_OLDEST, smoothing_kernel=BOXCAR, memory=None, replay_source=None, latency_dump_filename=None):
         self.fs = fs
         self.buffer_seconds = buffer_seconds
         self.prediction_seconds = prediction_seconds
-        self.timepoints_to_chop = 300 # How many timepoints to disregard from the most recent (this sets back the lag of prediction)
+        self.timepoints_to_chop = timepoints_to_chop # How many timepoints to disregard from the most recent (this sets back the lag of prediction)
         if to_clean: 
             if prediction_seconds * fs > (buffer_seconds * fs - self.timepoints_to_chop): 
-                print("Warning: prediction window may contain edge artifacts because it is larger than 500 timepoints less than the buffer size")
+                print("Warning: prediction window may contain edge artifacts because it is larger than", self.timepoints_to_chop, "timepoints less than the buffer size")
                 self.timepoints_to_chop = (buffer_seconds * fs - prediction_seconds * fs) // 2 # Take the middle half to reduce edge artifacts
         self.channels = channels # These are the channels we want
         
         self.live = live
+        self.replay_source = replay_source # A ReplaySource to stream a recorded session from instead of artificial data
         self.model = model
         if model is not None: 
             self.classes = list(self.model.model.classes_)
             self.index_of_left = self.classes.index(1)
             print("classes", self.classes)
+        self.spectrum = self.__new_spectrum(model)
 
         # If generating artificial data, this will cap the # of seconds we get artificial data to prevent while(true) runaways
         self.seconds_to_gather_artificial_data = 600 
         
-        self.buffer = np.zeros((fs * buffer_seconds, len(channels)))
-        self.raw_buffer = np.zeros((fs * buffer_seconds, len(channels)))
-        self.dc_removed_buffer = np.zeros((fs * buffer_seconds, len(channels)))
+        # The buffers and predictions read by other threads or processes live in the sampler memory
+        self.memory = memory if memory is not None else SamplerMemory(fs * buffer_seconds, len(channels))
+        self.buffer = self.memory.buffer
+        self.raw_buffer = RingBuffer(fs * buffer_seconds, (len(channels),))
+        self.dc_removed_buffer = RingBuffer(fs * buffer_seconds, (len(channels),))
         
-        self.pred_values = np.zeros((fs * buffer_seconds))
-        self.pred_values_average = np.zeros((fs * buffer_seconds))
+        # Running DC offset removed before filtering, then Bandpass + 60 Hz Notch applied to each block of samples as it arrives
+        self.dc_estimator = DCEstimator(len(channels), fs)
+        self.filter = StreamingFilter(len(channels), fs, (0.5, 50))
+        
+        self.pred_values = self.memory.pred_values
+        self.pred_values_average = self.memory.pred_values_average
+
+        # Predictions run off the acquisition thread, overload_policy decides what happens when they fall behind
+        self.inference_worker = InferenceWorker(self.__predict, self.__publish_prediction, overload_policy=overload_policy)
         self.update_seconds = update_seconds
-        self.last_updated = time.time()
-        self.mean = np.zeros(len(channels))
+        # Predictions are scheduled every hop_samples samples rather than on wall-clock time so they are reproducible in replay
+        self.hop_samples = max(1, int(round(update_seconds * fs)))
+        # Average the predictions over about a second, updated once per prediction
+        self.smoother = PredictionSmoother(max(1, round(fs / self.hop_samples)), smoothing_kernel)
+        self.prediction_history = deque(maxlen=PREDICTION_HISTORY_LENGTH)
+        self.event_history = deque(maxlen=EVENT_HISTORY_LENGTH) # Events of a replayed session, e.g. the start and end of its trials
+        self.last_arrival = latency_monitor.now() # When the latest block of samples arrived
+        self.latency_dump_filename = latency_dump_filename # Periodically dump the latency stats here while streaming
         self.count_samples = 0
         self.to_clean = to_clean
         self.started = False
@@ -65,11 +93,19 @@ class EEGSampler:
         '''
             Allows for the model to be updated
         '''
+        self.spectrum = self.__new_spectrum(model)
         self.model = model
         self.classes = list(self.model.model.classes_)
         self.index_of_left = self.classes.index(1)
         print("classes", self.classes)
 
+    def setSmoothingKernel(self, kernel):
+        '''
+            Switch the kernel used for the averaged prediction values (see PredictionSmoother)
+        '''
+        self.smoother.setKernel(kernel)
+        self.memory.prediction_average = self.smoother.getValue()
+
     def startStream(self) :
         print("start streaming called")
         if not self.started:
@@ -80,9 +116,15 @@ class EEGSampler:
                 print("LIVE: started eeg streaming")
                 self.board = OpenBCICyton()
                 self.eeg_thread = threading.Thread(target=self.board.start_stream, args=(self.push_data_sample,))
+            elif self.replay_source is not None: 
+                print("REPLAY: started")
+                self.eeg_thread = threading.Thread(target=self.replay_source.run, args=(self.push_data_samples, self.push_event))
             else :
                 print("FAKE DATA: started")
                 self.eeg_thread = threading.Thread(target=self.__generate_artificial_data, args=(self.push_data_sample,))
+            self.inference_worker.start()
+            if self.latency_dump_filename is not None: 
+                latency_monitor.startDump(self.latency_dump_filename)
             self.eeg_thread.start()
 
     def end(self): 
@@ -92,25 +134,72 @@ class EEGSampler:
             if self.live: 
                 print("LIVE: ended eeg streaming")
                 self.board.stop_stream()
+            elif self.replay_source is not None: 
+                print("REPLAY: ended")
+                self.replay_source.stop()
             else :
                 print("FAKE DATA: ended")
+            self.inference_worker.stop()
+            if self.latency_dump_filename is not None: 
+                latency_monitor.stopDump()
     
     ########################
     ## BUFFER GET METHODS ##
     ########################
     
+    # All buffers are read-only views ordered newest first
     def getBuffer(self):
-        return self.buffer
+        return self.buffer.getLatest()
         
     def getPredictionValue(self):  
-        return self.pred_values[0]
+        return self.memory.prediction
     def getPredictionValues(self):  
-        return self.pred_values
+        return self.pred_values.getLatest()
 
     def getPredictionValueAverage(self):  
-        return self.pred_values_average[0]
+        return self.memory.prediction_average
     def getPredictionValueAverages(self):  
-        return self.pred_values_average
+        return self.pred_values_average.getLatest()
+
+    def getPredictionIndex(self):
+        '''
+            Sample index of the last sample in the window of the latest prediction
+        '''
+        return self.memory.prediction_index
+
+    def getPredictionTime(self):
+        '''
+            time.perf_counter() time the latest prediction was published
+        '''
+        return self.memory.prediction_time
+
+    def getLatencyStats(self):
+        '''
+            Rolling latency percentiles of the pipeline stages and its counters, see LatencyMonitor
+        '''
+        stats = latency_monitor.getStats()
+        stats['counters']['dropped_windows'] = self.inference_worker.num_dropped
+        return stats
+
+    def getPredictionHistory(self):
+        '''
+            List of (sample index of the window end, prediction) for the latest predictions, oldest first
+        '''
+        return list(self.prediction_history)
+
+    def getEventHistory(self):
+        '''
+            List of (sample index, event) for the latest events of a replayed session, oldest first. The sample
+            indices count from the start of the stream like the window ends of getPredictionHistory()
+        '''
+        return list(self.event_history)
+
+    def getSnapshot(self, n_samples=None):
+        '''
+            Consistent read-only copy of the latest samples and predictions for readers on other
+            threads, see SamplerMemory.getSnapshot
+        '''
+        return self.memory.getSnapshot(n_samples)
 
     
     ############################
@@ -124,66 +213,115 @@ class EEGSampler:
             time.sleep(0.004) # Sample at 250 Hz 
             limit_counter += 1
         
-    def __filter_eeg(self):
-        # Bandpass + 60 Hz Notch
-        for i, chan in enumerate(self.channels):
-            self.buffer[:self.count_samples, i] = filterEEG(self.dc_removed_buffer[:self.count_samples, i], self.fs, (0.5, 50))
+    def __new_spectrum(self, model):
+        # Models that predict from spectral features reuse the work of the overlapping prediction windows,
+        # the spectrum is only touched by the inference worker
+        if hasattr(model, 'predict_proba_spectral'):
+            return SlidingSpectrum(self.prediction_seconds * self.fs, model.binning, newest_first=True)
+        return None
 
     def __update_prediction_buffer(self):
         # Take a 4 second window timepoints_to_chop timepoints away from the end of the buffer to reduce edge effects
-        data = np.transpose(self.buffer[self.timepoints_to_chop : self.prediction_seconds * self.fs + self.timepoints_to_chop])
-        
-        prediction = self.model.predict_proba(np.array([data]))[0]
+        # The window is copied so the acquisition thread can keep writing while the worker predicts
+        data = np.transpose(self.buffer.getLatest(self.prediction_seconds * self.fs + self.timepoints_to_chop)[self.timepoints_to_chop:]).copy()
+        window_end = self.buffer.count - 1 - self.timepoints_to_chop
+        self.inference_worker.submit((window_end, data, self.last_arrival, latency_monitor.now()))
+
+    def __predict(self, window):
+        # Runs on the inference worker thread
+        window_end, data, arrival, submitted = window
+        latency_monitor.recordSince('queue_wait', submitted)
+        start = latency_monitor.now()
+        model, spectrum = self.model, self.spectrum
+        if spectrum is not None: 
+            # Only the samples that entered the window since the previous prediction are processed
+            features = spectrum.update(data, window_end)
+            latency_monitor.recordSince('features', start)
+            prediction = model.predict_proba_spectral(*features)
+        else :
+            prediction = model.predict_proba(np.array([data]))[0]
+        latency_monitor.recordSince('inference', start)
         print("prediction: ", prediction)
-        prediction = prediction[self.index_of_left]
-        self.pred_values[0] = prediction 
-        
-        self.pred_values_average = np.roll(self.pred_values_average, 1, 0) 
-        # Update average values
-        self.pred_values_average[0] = np.mean(self.pred_values[:self.fs])
+        return window_end, prediction[self.index_of_left], arrival
+
+    def __publish_prediction(self, result):
+        window_end, prediction, arrival = result
+        # Single assignments so readers never see a partially updated prediction
+        self.memory.prediction_average = self.smoother.update(prediction)
+        self.memory.prediction = prediction
+        self.memory.prediction_index = window_end
+        self.memory.prediction_time = latency_monitor.now()
+        latency_monitor.recordSince('sample_to_prediction', arrival)
+        latency_monitor.increment('predictions')
+        self.prediction_history.append((window_end, prediction))
 
     
     ###########################
     ## CALLBACK FOR NEW DATA ##
     ###########################
     def push_data_sample(self, sample):
-        # Count the number of samples up till the full buffer (this is for mean calculation)
-        if self.count_samples < self.fs * self.buffer_seconds: 
-            self.count_samples += 1
-        
-        # Get the scaled channel data
+        # Get the channel data of the single sample
+        if self.live: 
+            sample = sample.channels_data
+        self.push_data_samples(np.array(sample)[np.newaxis, :])
+
+    def push_data_samples(self, samples):
+        '''
+            Accepts a block of samples shaped (#samples, #channels) ordered oldest first, 
+            where the channels are all the channels of the board
+        '''
+        self.last_arrival = latency_monitor.now()
+        latency_monitor.increment('samples', len(samples))
+        samples = np.asarray(samples)
+        # Get the scaled channel data for the whole block at once
         if self.live: 
-            raw_eeg_data = np.array(sample.channels_data)[self.channels] * SCALE_FACTOR_EEG
+            raw_eeg_data = samples[:, self.channels] * SCALE_FACTOR_EEG
         else :
-            raw_eeg_data = np.array(sample)[self.channels]
-        
-        # Roll and prepend the buffer with the new data
-        self.raw_buffer = np.roll(self.raw_buffer, 1, 0)
-        self.buffer = np.roll(self.buffer, 1, 0)
-        self.dc_removed_buffer = np.roll(self.dc_removed_buffer, 1, 0)
-        self.pred_values = np.roll(self.pred_values, 1, 0)
-        self.pred_values_average = np.roll(self.pred_values_average, 1, 0)
-        for i, chan in enumerate(self.channels):
-            self.raw_buffer[0, i] = raw_eeg_data[i]
+            raw_eeg_data = samples[:, self.channels]
+        self.__ingest(raw_eeg_data)
+
+    def push_event(self, event, sample_index):
+        '''
+            Accepts an event like 'start_1' that happened at the given sample index, called after that sample was pushed
+        '''
+        self.event_history.append((sample_index, event))
+
+    def __ingest(self, raw_eeg_data):
+        # Split the block at the prediction hops so every prediction window ends exactly on a hop
+        start = 0
+        while start < len(raw_eeg_data):
+            end = start + self.hop_samples - self.buffer.count % self.hop_samples
+            self.__append(raw_eeg_data[start:end])
+            start = end
+
+            # Only predict once we've reached the number of samples we need in the buffer
+            if self.buffer.count % self.hop_samples == 0:
+                if (self.count_samples > self.prediction_seconds * self.fs + self.timepoints_to_chop): 
+                    if (self.model is not None):
+                        self.__update_prediction_buffer()
+
+    def __append(self, raw_eeg_data):
+        n = len(raw_eeg_data)
+        # Count the number of samples up till the full buffer
+        self.count_samples = min(self.count_samples + n, self.fs * self.buffer_seconds)
+
+        # Prepend the buffers with the new data
+        self.memory.sequence += 1
+        try:
+            self.raw_buffer.extend(raw_eeg_data)
             if self.to_clean:  
-                self.dc_removed_buffer[0, i] = self.raw_buffer[0,i] - self.mean[i]
-                self.buffer[0, i] = self.dc_removed_buffer[0, i]
+                start = latency_monitor.now()
+                dc_removed_eeg_data = self.dc_estimator.process(raw_eeg_data)
+                self.dc_removed_buffer.extend(dc_removed_eeg_data)
+                self.buffer.extend(self.filter.process(dc_removed_eeg_data))
+                latency_monitor.recordSince('filter', start)
             else : 
-                self.dc_removed_buffer[0, i] = self.raw_buffer[0, i] 
-                self.buffer[0, i] = self.raw_buffer[0, i] 
-            self.pred_values[0] = self.pred_values[1]
-            self.pred_values_average[0] = np.mean(self.pred_values[:self.fs])
-        
-        # Calculate the new mean if the update time has passed
-        now = time.time()
-        if (now - self.last_updated) > self.update_seconds :
-            self.last_updated = now
+                self.dc_removed_buffer.extend(raw_eeg_data)
+                self.buffer.extend(raw_eeg_data)
 
-            # Only predict once we've reached the number of samples we need in the buffer
-            if (self.count_samples > self.prediction_seconds * self.fs + self.timepoints_to_chop): 
-                if (self.to_clean):
-                    self.__filter_eeg()
-                if (self.model is not None):
-                    self.__update_prediction_buffer()
-   
-                
\ No newline at end of file
+            # Carry the latest prediction and its average forward to the new samples
+            self.pred_values.extend(np.full(n, self.memory.prediction))
+            self.pred_values_average.extend(np.full(n, self.memory.prediction_average))
+        finally:
+            # The sequence is even again even if the block failed, so readers aren't locked out of every later block
+            self.memory.sequence += 1
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+
+class EpochSet:
+    """ The epochs of a session as one contiguous (#epochs, #chans, #timepoints) array, with the label and
+        start time of every epoch.
+
+        Epochs are kept sorted by label, so selecting labels that are next to each other in sorted order,
+        e.g. select(1, 2) for left vs right hand imagery, returns views into the same data without copying.
+        An EpochSet is saved to a .npz file, or to a directory of .npy files that load() can memory map.
+    """
+    def __init__(self, data, labels, start_times, chans):
+        labels = np.asarray(labels)
+        order = np.argsort(labels, kind='stable')
+        in_order = np.all(order == np.arange(len(order)))
+        # Already sorted data, e.g. loaded or selected from another EpochSet, is used as is
+        self.data = np.asarray(data, dtype=float) if in_order else np.ascontiguousarray(np.asarray(data, dtype=float)[order])
+        self.labels = labels if in_order else labels[order]
+        self.start_times = np.asarray(start_times, dtype=float) if in_order else np.asarray(start_times, dtype=float)[order]
+        self.chans = list(chans)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def getUniqueLabels(self):
+        return np.unique(self.labels)
+
+    def select(self, *labels):
+        '''
+            EpochSet of the epochs with any of the given labels, sharing the data when those labels are contiguous
+        '''
+        unique_labels = self.getUniqueLabels()
+        positions = np.flatnonzero(np.isin(unique_labels, labels))
+        if len(positions) == 0:
+            return EpochSet(self.data[:0], self.labels[:0], self.start_times[:0], self.chans)
+        if positions[-1] - positions[0] == len(positions) - 1:
+            start = np.searchsorted(self.labels, unique_labels[positions[0]], side='left')
+            end = np.searchsorted(self.labels, unique_labels[positions[-1]], side='right')
+            return EpochSet(self.data[start:end], self.labels[start:end], self.start_times[start:end], self.chans)
+        selected = np.isin(self.labels, labels)
+        return EpochSet(self.data[selected], self.labels[selected], self.start_times[selected], self.chans)
+
+    def save(self, filename):
+        '''
+            Save to filename.npz, or to the directory filename as one .npy file per array when it doesn't end in .npz
+        '''
+        arrays = {'data': self.data, 'labels': self.labels, 'start_times': self.start_times, 'chans': np.array(self.chans)}
+        if filename.endswith('.npz'):
+            np.savez(filename, **arrays)
+        else :
+            os.makedirs(filename, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(filename, name + '.npy'), array)
+
+    @staticmethod
+    def load(filename, mmap_mode=None):
+        '''
+            Load an EpochSet written by save(), a directory is memory mapped with mmap_mode (e.g. 'r') if given
+        '''
+        if filename.endswith('.npz'):
+            with np.load(filename) as arrays:
+                return EpochSet(arrays['data'], arrays['labels'], arrays['start_times'], arrays['chans'].tolist())
+        data = np.load(os.path.join(filename, 'data.npy'), mmap_mode=mmap_mode)
+        arrays = [np.load(os.path.join(filename, name + '.npy')) for name in ('labels', 'start_times', 'chans')]
+        return EpochSet(data, arrays[0], arrays[1], arrays[2].tolist())
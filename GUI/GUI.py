@@ -24,11 +24,16 @@ from pyautogui import keyDown, keyUp, click # For controlling Google Maps
 
 # Our own functions
 from EEGSampler import EEGSampler
+from AcquisitionProcess import AcquisitionProcess
+from ReplaySource import ReplaySource
 from EEGRecorder import EEGRecorder
 from CSVWriter import CSVWriter
 from DataProcessingHelper import * 
 from PowerBinModel import PowerBinModel
+from ModelTrainer import ModelTrainer, DONE, FAILED, EVALUATING
 from KeyPress import perform_google_maps_action
+from PredictionSmoother import SMOOTHING_KERNELS
+from LatencyMonitor import latency_monitor
 
 # Timing and timers
 import time
@@ -47,6 +52,10 @@ from sklearn.metrics import classification_report
 
 # Recording Settings 
 LIVE_DATA = False ## Change this to true if running with live data
+REPLAY_DATA = False ## Change this to true to stream the pre-recorded session instead of random data when not live
+REPLAY_SPEED = 1 # 1 for real time, None for as fast as possible
+ACQUISITION_PROCESS = False ## Change this to true to run acquisition and inference in their own process, away from the GUI
+LATENCY_DUMP_FILENAME = None # Set to e.g. "./data/latency.jsonl" to append pipeline latency stats every few seconds
 CHANNELS_USED = [4, 5, 6, 7] # Corresponding to the pins used on the Cyton
 
 # Calibration Trials
@@ -63,6 +72,11 @@ f2 = [2]*feedback_num_trials
 f_12 = f1 + f2
 random.shuffle(f_12)
 
+# NeuroFeedback slider smoothing, 'none' follows the raw predictions
+NO_SMOOTHING = 'none'
+SLIDER_SMOOTHING_OPTIONS = [NO_SMOOTHING] + SMOOTHING_KERNELS
+DEFAULT_SLIDER_SMOOTHING = NO_SMOOTHING
+
 # Fonts
 BOLD_FONT= ("Verdana", 12, 'bold')
 
@@ -73,6 +87,7 @@ PRE_RECORDED_EVENT_OUTPUT_FILENAME = "./data/event_data 15_motorvis.csv"
 LIVE_EEG_OUTPUT_FILENAME = "./data/eeg_data.csv"
 LIVE_EVENT_OUTPUT_FILENAME = "./data/event_data.csv"
 Pkl_Filename = "PowerBinModel.pkl"
+TRAINING_CACHE_DIR = "./cache" # Filtered data, epochs, features and models of previous trainings, None to always train from scratch
 
 # Trial timing
 START_REST_TIME = 1000 
@@ -81,6 +96,7 @@ ARROW_FINISH_TIME = BEEP_FINISH_TIME + 1000 # 1s to show arrow
 TRIAL_FINISH_TIME = ARROW_FINISH_TIME + 4000 # 4s for actual trial
 TRIAL_BASEEXTRA_TIME = TRIAL_FINISH_TIME + 500 # 0.5s to finish trial
 MAX_EXTRA_TIME = 1000 # randomly give an extra 0 to MAX_EXTRA_TRIAL time between trials
+TRAINING_POLL_MS = 100 # How often the training progress is checked while a model trains
 
 ###############################################################################
 # Classes for frames   
@@ -101,7 +117,17 @@ class FrameContainer(tk.Tk):
 
         with open(Pkl_Filename, 'rb') as file:
             self.model = pickle.load(file) # Load the classification model
-        self.eeg_sampler = EEGSampler(LIVE_DATA, channels=CHANNELS_USED, model=self.model)
+        replay_source = None
+        if REPLAY_DATA and not LIVE_DATA: 
+            replay_source = ReplaySource(PRE_RECORDED_EEG_OUTPUT_FILENAME, PRE_RECORDED_EVENT_OUTPUT_FILENAME, channels=CHANNELS_USED, speed=REPLAY_SPEED)
+        if LATENCY_DUMP_FILENAME is not None: 
+            latency_monitor.startDump(LATENCY_DUMP_FILENAME)
+        if ACQUISITION_PROCESS: 
+            # The acquisition process dumps the latencies of its own stages to the same file
+            self.eeg_sampler = AcquisitionProcess(LIVE_DATA, channels=CHANNELS_USED, model=self.model, replay_source=replay_source, 
+                                                  latency_dump_filename=LATENCY_DUMP_FILENAME)
+        else :
+            self.eeg_sampler = EEGSampler(LIVE_DATA, channels=CHANNELS_USED, model=self.model, replay_source=replay_source)
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         
@@ -236,14 +262,12 @@ class DataViewer(tk.Frame):
             The animate function for FuncAnimate 
         '''
         xList = self.x_values
-        yList = self.eeg_sampler.getBuffer()[200:len(xList) + 200, :4].T # Offset by 100 to reduce the visibility of the filter lag
-        yFlipped = []
-        for elem in yList:
-            yFlipped.append(np.flip(elem))
-        self.__plotMultilines(self.eeg_plot, xList, yFlipped)
+        # One consistent snapshot, oldest first, for both plots
+        snapshot = self.eeg_sampler.getSnapshot(len(xList) + 200)
+        yList = snapshot.eeg[:len(xList), :4].T # Offset by 200 to reduce the visibility of the filter lag
+        self.__plotMultilines(self.eeg_plot, xList, yList)
 
-        xList = self.x_values
-        yList = np.flip(self.eeg_sampler.getPredictionValues().T[100:len(xList) + 100])
+        yList = snapshot.predictions[100:len(xList) + 100] # Offset by 100
         self.__plotMultilines(self.average_pred_plot, xList, [yList])
 
 
@@ -461,70 +485,49 @@ class TrainingPrompt(tk.Frame):
         self.label = tk.Label(self, text="Training...", font=BOLD_FONT)
         self.label.pack(pady=10,padx=10)
         self.model_trained = False
+        self.model_trainer = None
 
 
     def show(self):
-        if not self.model_trained:
+        if not self.model_trained and self.model_trainer is None:
             self.train_model()
 
-            # Update the EEG sampler's model with the newly trained
-            with open(Pkl_Filename, 'rb') as file:
-                model = pickle.load(file) 
-                self.eeg_sampler.setModel(model)
-            
-            self.model_trained = True
-
     def train_model(self):
+        # The model trains in its own process, this only starts it and polls it for progress from the Tk event loop
+        self.start_time = time.time()
 
-        start_time = time.time()
-
-        ## Loading data
         eeg_filename = LIVE_EEG_OUTPUT_FILENAME if LIVE_DATA else PRE_RECORDED_EEG_OUTPUT_FILENAME
         event_filename =  LIVE_EVENT_OUTPUT_FILENAME if LIVE_DATA else PRE_RECORDED_EVENT_OUTPUT_FILENAME
 
         eeg_chans = ['C4','C2', 'C1', 'C3']
-        chans = eeg_chans
-        eeg_df = pd.read_csv(eeg_filename)
-        eeg_df.columns=['time','C4', 'C2', 'C1', 'C3']
-
-        event_df = pd.read_csv(event_filename)
-        event_df.columns=['time', 'EventStart']
-        event_types = {0:"eye_close", 1:"left", 2:"right", 3:"foot", 4:"idle"}
-
-        # Filter the full data
-        filtered_df = eeg_df.copy()
-        for chan in chans:
-            filtered_df[chan] = filterEEG(filtered_df[chan].values)
-        # Process dfs to get labels, raw eeg epochs, epochs of filtered eeg data, filtered epoch data
-        output_labels, epoch_times = getOutputLabelsAndEpochTimes(event_df)
-        filtered_epochs = getEEGEpochs(epoch_times, filtered_df, eeg_chans) # Epoched after filtering
-
-        # Create DataFrames
-        filtered_epoch_df = getDF(filtered_epochs, output_labels, epoch_times, chans)
-        # Extract trials that are for left vs right hand imagery
-        df_to_use = filtered_epoch_df
-        filtered_epoch_bi_class_df = df_to_use[(df_to_use['event_type'] == 1) | (df_to_use['event_type'] == 2)]
-        X = filtered_epoch_bi_class_df[eeg_chans].values
-        Y = filtered_epoch_bi_class_df['event_type'].values
-
-        # Accuracy on the shuffled train and test split
-        num_feats_used = 8
-        power_bin_model = PowerBinModel(eeg_chans, num_top=num_feats_used)
-
-        power_bin_model.fit(X, Y)
-        all_feats = power_bin_model.getFeatureNames()
-        num_feats = len(all_feats)
-        print("num total feats", num_feats)
-        print("num used", num_feats_used)
-        for i in power_bin_model.feature_indx: 
-            print(all_feats[i])
-
-        with open(Pkl_Filename, 'wb') as file:  
-            pickle.dump(power_bin_model, file)
-
+        self.model_trainer = ModelTrainer(eeg_filename, event_filename, eeg_chans, num_top=8, model_filename=Pkl_Filename,
+                                          cache_dir=TRAINING_CACHE_DIR)
+        self.model_trainer.start()
+        self.label.after(TRAINING_POLL_MS, self.poll_training)
+
+    def poll_training(self):
+        for stage, detail in self.model_trainer.poll():
+            if stage == DONE:
+                # The EEG sampler gets the trained model directly, the pickle on disk is for the next start up
+                self.eeg_sampler.setModel(detail)
+                self.model_trained = True
+                self.finish_training()
+            elif stage == FAILED:
+                print(detail)
+                self.label.config(text = "Training failed, see the console for the error")
+                self.model_trainer = None
+            elif stage == EVALUATING:
+                mod_name, num_done, num_folds = detail
+                self.label.config(text = "Training... evaluating " + mod_name + " " + str(num_done) + "/" + str(num_folds))
+            else :
+                self.label.config(text = "Training... " + stage)
+        if self.model_trainer is not None and not self.model_trainer.finished:
+            self.label.after(TRAINING_POLL_MS, self.poll_training)
+
+    def finish_training(self):
         end_time = time.time()
         print("finished training")
-        self.label.config(text = "Finished Training in " + str(end_time-start_time) + " seconds!")
+        self.label.config(text = "Finished Training in " + str(end_time-self.start_time) + " seconds!")
         self.button = ttk.Button(self, text="Continue to NeuroFeedback",
                             command=lambda: self.controller.show_frame(FeedbackPrompt))
         self.button.pack()
@@ -552,6 +555,12 @@ class FeedbackPrompt(tk.Frame):
         self.instructions_label = tk.Label(self, text = '')
         self.instructions_label.pack()
 
+        # Create the slider smoothing selector
+        self.smoothing = tk.StringVar(self)
+        self.smoothing_menu = ttk.OptionMenu(self, self.smoothing, DEFAULT_SLIDER_SMOOTHING, 
+                    *SLIDER_SMOOTHING_OPTIONS, command=self.setSmoothing)
+        self.smoothing_menu.pack()
+
         # Create cross canvas
         self.canvas = tk.Canvas(self)
         self.canvas.pack(fill=tk.BOTH, expand=1)
@@ -683,9 +692,17 @@ class FeedbackPrompt(tk.Frame):
                     else :
                         self.label_trial.config(text='NeuroFeedback Completed! Please "Launch Google Maps" to continue')
 
-            self.slide_proba = self.eeg_sampler.getPredictionValue() # Represents left probability
+            # Represents left probability
+            if self.smoothing.get() == NO_SMOOTHING: 
+                self.slide_proba = self.eeg_sampler.getPredictionValue() 
+            else :
+                self.slide_proba = self.eeg_sampler.getPredictionValueAverage()
             self.label_timer.after(125, self.update)
 
+    def setSmoothing(self, kernel):
+        if kernel != NO_SMOOTHING:
+            self.eeg_sampler.setSmoothingKernel(kernel)
+
     def useApp(self):
         # Launch Google Maps 
         print("loading browser")
@@ -713,7 +730,7 @@ class FeedbackPrompt(tk.Frame):
 
     def sendCommands(self):
         if self.can_update:
-            perform_google_maps_action((1 - self.slide_proba) * 2 - 1)
+            perform_google_maps_action((1 - self.slide_proba) * 2 - 1, prediction_time=self.eeg_sampler.getPredictionTime())
             self.label_trial.after(250, self.sendCommands)
 
     def render(self):
@@ -0,0 +1,86 @@
+import queue
+import threading
+import traceback
+
+# Overload policies for when predictions are requested faster than the model can run
+DROP_OLDEST = 'drop_oldest' # Keep up to max_pending windows, discarding the oldest one when full
+COALESCE = 'coalesce' # Only keep the newest window, replacing whatever was still waiting
+BLOCK = 'block' # Wait for room in the queue so no window is ever skipped, e.g. for reproducible replays
+
+STOP_POLL_SECONDS = 0.1 # How often a waiting worker or BLOCK submit checks whether the worker is stopping
+
+class InferenceWorker:
+    """ Runs model predictions on a background thread so a slow prediction never stalls sample intake.
+
+        Windows are handed over through a bounded queue with submit(), and every result is passed
+        to the publish callback from the worker thread. stop() lets the worker finish the windows
+        already queued, windows submitted while or after it stops are discarded.
+    """
+    def __init__(self, predict, publish, max_pending=2, overload_policy=DROP_OLDEST):
+        if overload_policy not in (DROP_OLDEST, COALESCE, BLOCK):
+            raise ValueError("Unknown overload policy: " + str(overload_policy))
+        self.predict = predict
+        self.publish = publish
+        self.overload_policy = overload_policy
+        self.queue = queue.Queue(maxsize=1 if overload_policy == COALESCE else max_pending)
+        self.num_dropped = 0 # Windows discarded because inference fell behind
+        self.thread = None
+        self.stopping = threading.Event() # Set by stop(), outside the queue so no overload policy can discard it
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.stopping.set()
+            self.thread.join()
+
+    def submit(self, window):
+        '''
+            Queue a window for prediction, only blocking the caller with the BLOCK policy
+        '''
+        if self.stopping.is_set():
+            return
+        if self.overload_policy == BLOCK:
+            # Waits in short steps so a stopped worker can't leave the caller blocked on a full queue
+            while not self.stopping.is_set():
+                try:
+                    self.queue.put(window, timeout=STOP_POLL_SECONDS)
+                    return
+                except queue.Full:
+                    pass
+        else :
+            self.__put(window)
+
+    ############################
+    ## PRIVATE HELPER METHODS ##
+    ############################
+    def __put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                # Make room by discarding the window that has waited the longest
+                try:
+                    self.queue.get_nowait()
+                    self.num_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def __run(self):
+        while True:
+            try:
+                window = self.queue.get(timeout=STOP_POLL_SECONDS)
+            except queue.Empty:
+                # Only stop once the windows queued before stop() have been predicted
+                if self.stopping.is_set():
+                    return
+                continue
+            try:
+                self.publish(self.predict(window))
+            except Exception:
+                traceback.print_exc()
@@ -13,13 +13,15 @@ from typing import List
 	prob_range | List[float]		| Range for left_prob
 	thresholds | List[List[float]]	| Specific range for each keypress event
 	keys       | List[str]			| Keys to press
+	prediction_time | float			| time.perf_counter() time of the prediction behind left_prob, for latency stats
 
 '''
 def perform_google_maps_action(
 	left_prob: float,
 	prob_range:List[float] = [-1,1],
 	thresholds:List[List[float]] = [[-1,-1/3],[-1/3,1/3],[1/3,1]],
-	keys:List[str] = ["left","up","right"]
+	keys:List[str] = ["left","up","right"],
+	prediction_time:float = None
 ):
 	# Making sure params are correctly used
 	assert (len(prob_range) == 2)
@@ -42,7 +44,7 @@ def perform_google_maps_action(
 			keypress_ind = i
 
 	# Send keypress to active window
-	send_keypress(keys[keypress_ind])
+	send_keypress(keys[keypress_ind], prediction_time)
 
 '''
 
@@ -52,6 +54,7 @@ def perform_google_maps_action(
 	Param	   | Type				| Def
 	_________________________________________________________________________
 	key        | str				| Key to press
+	prediction_time | float			| time.perf_counter() time of the prediction behind the keypress
 
 '''
 
@@ -64,13 +67,17 @@ from datetime import datetime
 import time
 import numpy as np
 
-def send_keypress(key: str):
+from LatencyMonitor import latency_monitor
+
+def send_keypress(key: str, prediction_time: float = None):
 	# Header for event
 	print(datetime.now().strftime("%m/%d/%Y %H:%M:%S").center(40,"="))
 	print(f"Got a call for '{key}'.")
 
 	# Send Keypress
 	keyDown(key)
+	if prediction_time: # 0 or None until there has been a prediction
+		latency_monitor.recordSince('prediction_to_action', prediction_time)
 	print(f"Sent keypress for '{key}'.")
 	time.sleep(0.5)
 	keyUp(key)
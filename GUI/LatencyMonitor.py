@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_HISTORY = 1024 # Number of latest latencies kept per stage for the rolling percentiles
+DEFAULT_DUMP_SECONDS = 5
+
+class LatencyHistogram:
+    """ Rolling window of the latest latencies of one pipeline stage.
+
+        Each stage is recorded from a single thread, so record() is a plain array write and
+        needs no lock. Percentiles are only computed when stats are requested.
+    """
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.latencies = np.zeros(history)
+        self.count = 0
+
+    def record(self, seconds):
+        self.latencies[self.count % len(self.latencies)] = seconds
+        self.count += 1
+
+    def getStats(self):
+        '''
+            Count of all recorded latencies and p50/p95/p99/mean/max of the rolling window, in ms
+        '''
+        latencies = self.latencies[:min(self.count, len(self.latencies))] * 1000
+        if len(latencies) == 0:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'count': self.count, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                'mean_ms': np.mean(latencies), 'max_ms': np.max(latencies)}
+
+
+class LatencyMonitor:
+    """ Timestamps, counters and rolling latency histograms for the stages of the prediction pipeline.
+
+        Stages use monotonic time.perf_counter() timestamps, e.g.
+            start = latency_monitor.now()
+            ...
+            latency_monitor.recordSince('filter', start)
+    """
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.history = history
+        self.histograms = {}
+        self.counters = {}
+        self.dump_thread = None
+        self.dumping = False
+        # A forked process, e.g. the AcquisitionProcess, records and dumps its own stages
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__afterFork)
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, LatencyHistogram(self.history))
+        histogram.record(seconds)
+
+    def recordSince(self, stage, start):
+        self.record(stage, time.perf_counter() - start)
+
+    def increment(self, counter, n=1):
+        # Like the histograms, every counter is only incremented from one thread
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def getStats(self):
+        '''
+            Stats of every stage plus the counters, e.g. getStats()['stages']['sample_to_prediction']['p95_ms']
+        '''
+        return {'stages': {stage: histogram.getStats() for stage, histogram in list(self.histograms.items())},
+                'counters': dict(self.counters)}
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+
+    ##################
+    ## DUMP METHODS ##
+    ##################
+    def startDump(self, filename, interval_seconds=DEFAULT_DUMP_SECONDS):
+        '''
+            Append the stats as a JSON line to filename every interval_seconds
+        '''
+        if self.dump_thread is None:
+            self.dumping = True
+            self.dump_thread = threading.Thread(target=self.__dump, args=(filename, interval_seconds), daemon=True)
+            self.dump_thread.start()
+
+    def stopDump(self):
+        if self.dump_thread is not None:
+            self.dumping = False
+            self.dump_thread.join()
+            self.dump_thread = None
+
+    def __afterFork(self):
+        # The dump thread isn't copied into the child, only the reference to it
+        self.dump_thread = None
+        self.dumping = False
+        self.reset()
+
+    def __dump(self, filename, interval_seconds):
+        while self.dumping:
+            time.sleep(interval_seconds)
+            line = dict(self.getStats(), time=time.time(), pid=os.getpid())
+            with open(filename, 'a') as file:
+                file.write(json.dumps(line, default=float) + "\n")
+
+
+# Shared by all the modules of the pipeline in this process
+latency_monitor = LatencyMonitor()
@@ -0,0 +1,152 @@
+import multiprocessing
+import queue
+import atexit
+import pickle
+import traceback
+
+import pandas as pd
+
+from DataProcessingHelper import filterEEG, getOutputLabelsAndEpochTimes, getEpochSet
+from PowerBinModel import PowerBinModel
+from StageCache import StageCache
+
+# Training stages, sent as (stage, detail) progress messages
+LOADING = 'loading'
+FILTERING = 'filtering'
+EPOCHING = 'epoching'
+FEATURES = 'features'
+EVALUATING = 'evaluating' # detail is (model name, #folds done, #folds) of the leave one out model selection
+SAVING = 'saving'
+DONE = 'done' # detail is the fitted PowerBinModel
+FAILED = 'failed' # detail is the traceback of the error
+MODEL = 'model' # Cache stage of the fitted model
+
+TRAINING_LABELS = (1, 2) # Left vs right hand imagery
+FILTER_BAND = (1, 50) # Bandpass of the recorded signal before epoching, in Hz
+
+
+def trainModel(eeg_filename, event_filename, eeg_chans, num_top=8, model_filename=None, cache_dir=None, progress=None):
+    '''
+        Trains a PowerBinModel on the left vs right hand trials of a recorded session and saves it to model_filename
+        if given. progress(stage, detail) is called as the training goes through the stages above.
+        With cache_dir, the filtered signal, epochs, features and model are cached there and only the stages
+        whose input files or parameters changed since a previous run are computed
+    '''
+    if progress is None:
+        progress = lambda stage, detail: None
+    cache = StageCache(cache_dir)
+    power_bin_model = PowerBinModel(eeg_chans, num_top=num_top)
+
+    # Every stage's key covers its own parameters and the key of the stage it takes its input from
+    eeg_chans = list(eeg_chans)
+    filtered_key = cache.getKey(FILTERING, cache.getFileHash(eeg_filename), eeg_chans, FILTER_BAND)
+    epochs_key = cache.getKey(EPOCHING, filtered_key, cache.getFileHash(event_filename), TRAINING_LABELS)
+    features_key = cache.getKey(FEATURES, epochs_key, power_bin_model.binning)
+    model_key = cache.getKey(MODEL, features_key, num_top, [mod.__name__ for mod in power_bin_model.mod_types])
+
+    def getFilteredDF():
+        ## Loading data
+        progress(LOADING, None)
+        eeg_df = pd.read_csv(eeg_filename)
+        eeg_df.columns = ['time'] + eeg_chans
+
+        # Filter the full data
+        progress(FILTERING, None)
+        filtered_df = eeg_df.copy()
+        filtered_df[eeg_chans] = filterEEG(eeg_df[eeg_chans].values, f_range=FILTER_BAND, axis=0)
+        return filtered_df
+
+    def getEpochs():
+        filtered_df = cache.getOrCompute(FILTERING, filtered_key, getFilteredDF)
+        event_df = pd.read_csv(event_filename)
+        event_df.columns = ['time', 'EventStart']
+
+        # Process dfs to get labels and the epochs of filtered eeg data
+        progress(EPOCHING, None)
+        output_labels, epoch_times = getOutputLabelsAndEpochTimes(event_df)
+        filtered_epochs = getEpochSet(epoch_times, output_labels, filtered_df, eeg_chans) # Epoched after filtering
+        return filtered_epochs.select(*TRAINING_LABELS)
+
+    def getFeatures():
+        filtered_epochs_bi_class = cache.getOrCompute(EPOCHING, epochs_key, getEpochs)
+        progress(FEATURES, None)
+        return power_bin_model.getFeatureMatrix(filtered_epochs_bi_class), filtered_epochs_bi_class.labels
+
+    def getFittedModel():
+        X_features, Y = cache.getOrCompute(FEATURES, features_key, getFeatures)
+        power_bin_model.fit_features(X_features, Y,
+                                     progress=lambda mod, num_done, num_folds: progress(EVALUATING, (mod.__name__, num_done, num_folds)))
+        return power_bin_model
+
+    power_bin_model = cache.getOrCompute(MODEL, model_key, getFittedModel)
+    all_feats = power_bin_model.getFeatureNames()
+    print("num total feats", len(all_feats))
+    print("num used", num_top)
+    for i in power_bin_model.feature_indx:
+        print(all_feats[i])
+
+    # Saved for the next time the GUI starts
+    if model_filename is not None:
+        progress(SAVING, None)
+        with open(model_filename, 'wb') as file:
+            pickle.dump(power_bin_model, file)
+    return power_bin_model
+
+def run_training(training_kwargs, messages):
+    '''
+        Entry point of the training process: trains and sends the progress and then the model or error over messages
+    '''
+    try:
+        model = trainModel(progress=lambda stage, detail: messages.put((stage, detail)), **training_kwargs)
+        messages.put((DONE, model))
+    except Exception:
+        traceback.print_exc()
+        messages.put((FAILED, traceback.format_exc()))
+
+
+class ModelTrainer:
+    """ Runs trainModel in a separate process, so the Tk event loop keeps running while a model trains.
+
+        The training process sends its progress and finally the fitted model back over a queue, which
+        the GUI reads with poll() from an after() callback. Nothing else is shared with the process.
+    """
+    def __init__(self, eeg_filename, event_filename, eeg_chans, num_top=8, model_filename=None, cache_dir=None):
+        self.training_kwargs = dict(eeg_filename=eeg_filename, event_filename=event_filename, eeg_chans=list(eeg_chans),
+                                    num_top=num_top, model_filename=model_filename, cache_dir=cache_dir)
+        self.started = False
+        self.finished = False
+        atexit.register(self.stop)
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.messages = multiprocessing.Queue()
+            self.process = multiprocessing.Process(target=run_training, args=(self.training_kwargs, self.messages), daemon=True)
+            self.process.start()
+
+    def poll(self):
+        '''
+            All the (stage, detail) messages sent since the last poll, without blocking. The last message is
+            (DONE, model) or (FAILED, traceback) once the training has finished
+        '''
+        messages = []
+        while self.started and not self.finished:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                # The process can only have ended without its final message if it was killed
+                if not self.process.is_alive() and self.messages.empty():
+                    message = (FAILED, "Training process exited with code " + str(self.process.exitcode))
+                else :
+                    break
+            messages.append(message)
+            if message[0] in (DONE, FAILED):
+                self.finished = True
+                self.process.join()
+        return messages
+
+    def stop(self):
+        if self.started and not self.finished:
+            self.finished = True
+            self.process.terminate()
+            self.process.join()
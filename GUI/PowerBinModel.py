@@ -1,13 +1,35 @@
+import os
+
 import numpy as np
+from collections import namedtuple
+from functools import lru_cache
 
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import LeaveOneOut
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.metrics import accuracy_score
 
-from DataProcessingHelper import pyeeg, getIntervals, getPowerRatio
+from DataProcessingHelper import getIntervals
+from EpochSet import EpochSet
+from SpectralFeatures import getPowerRatios, getHjorth
+from LatencyMonitor import latency_monitor
+
+# Leave one out methods for model selection
+REFIT = 'refit' # Refit every model on every fold
+FAST = 'fast' # Closed form folds for LinearDiscriminantAnalysis and warm started folds for LogisticRegression, any other model is refit
+LOO_METHODS = (REFIT, FAST)
+
+# Scaler, feature selection and linear model of a fit PowerBinModel folded into weights on the per-channel features
+# (see PowerBinModel.compile), with the channels whose power ratios and Hjorth parameters have non zero weights
+CompiledModel = namedtuple('CompiledModel', ['intercept', 'ratio_weights', 'mobility_weights', 'complexity_weights', 'spectral_chans', 'hjorth_chans'])
+
+# Boolean masks of the left and right hemisphere channels, e.g. C3 is left and C4 is right
+@lru_cache(maxsize=8)
+def getHemisphereMasks(chans):
+    right = np.array([int(ch[1]) % 2 == 0 for ch in chans])
+    return ~right, right
 
 # Abstract class for enabling interchangable models
 class myModel:
@@ -41,45 +63,38 @@ class PowerBinModel(myModel):
 
         self.feature_indx = None
         self.num_top = num_top
+        self.compiled = None
         
     def getFeatureNames(self):
         return self.feat_names
-        
+
+    def getFeatureMatrix(self, X):
+        # Feature matrix (#Trials, #Features) of X (#Trials, #Chans, #Timepoints) or of an EpochSet, as fit_features takes
+        if isinstance(X, EpochSet):
+            X = X.data
+        return self._getFeatureMatrix(X)
+
     def _getFeatures(self, eeg_datas) :
-        feats = []
-        mobs = []
-        comps = []
-        left_powers = {}
-        right_powers = {}
-        for i, eeg_data in enumerate(eeg_datas): 
-            ratios = getPowerRatio(eeg_data, self.binning)
-            
-            feats.extend(ratios)
-
-            mob, comp = pyeeg.hjorth(eeg_data)
-            mobs.append(mob)
-            comps.append(comp)
-            ch = self.chans[i]
-            for i, interval in enumerate(self.intervals) : 
-                if (interval not in left_powers) or (interval not in right_powers): 
-                    left_powers[interval] = 0
-                    right_powers[interval] = 0
-                if int(ch[1]) % 2 == 0: 
-                    right_powers[interval] += ratios[i]
-                else : 
-                    left_powers[interval] += ratios[i]
-        feats.extend(mobs)
-        feats.extend(comps)
-        left_powers_list = [] 
-        right_powers_list = []
-        for i, interval in enumerate(self.intervals) : 
-            left_powers_list.append(left_powers[interval])
-            right_powers_list.append(right_powers[interval])
-        feats.extend(left_powers_list)
-        feats.extend(right_powers_list)
-        feats.extend(np.array(left_powers_list) - np.array(right_powers_list))
-        
-        return feats
+        # eeg_datas is (#Chans, #Timepoints), every channel goes through the same rfft
+        return self._getFeatureMatrix(np.asarray(eeg_datas)[np.newaxis])[0]
+
+    def _getFeatureMatrix(self, X) :
+        # X is (#Trials, #Chans, #Timepoints), all trials and channels go through the same rfft
+        X = np.asarray(X)
+        if X.dtype == object:
+            X = np.array(X.tolist(), dtype=float) # (#Trials, #Chans) of epoch arrays, e.g. the channel columns of getDF
+        ratios = getPowerRatios(X, self.binning)
+        mobs, comps = getHjorth(X)
+        return self.combineFeatures(ratios, mobs, comps)
+
+    def combineFeatures(self, ratios, mobs, comps) :
+        # Feature matrix (#Trials, #Features) from the power ratios (#Trials, #Chans, #Bins) and Hjorth parameters (#Trials, #Chans),
+        # or the feature vector of a single trial without the #Trials axis
+        left, right = getHemisphereMasks(tuple(self.chans))
+        left_powers = np.sum(ratios[..., left, :], axis=-2)
+        right_powers = np.sum(ratios[..., right, :], axis=-2)
+        ratios = ratios.reshape(ratios.shape[:-2] + (-1,))
+        return np.concatenate((ratios, mobs, comps, left_powers, right_powers, left_powers - right_powers), axis=-1)
     
     def _selectTopFeatures(self, X_features, Y) :
         # Get the unique classes of Y to be able to separate the features 
@@ -101,61 +116,176 @@ class PowerBinModel(myModel):
         X_features = np.transpose([X_features[:, i] for i in feature_indx])
         return X_features, feature_indx
 
-    def fit(self, X, Y):
-        # X shape must be (#Trials, #Chans, #Timepoints)
-        
+    def fit(self, X, Y=None, n_jobs=None, loo_method=REFIT, progress=None):
+        # X shape must be (#Trials, #Chans, #Timepoints), or X is an EpochSet with the labels as Y
+        # progress, if given, is called with the leave one out progress of the model selection (see _getLeaveOneOutPredictions)
+        if isinstance(X, EpochSet):
+            X, Y = X.data, X.labels
+        # The features are computed once for both the model selection and the final fit
+        self.fit_features(self._getFeatureMatrix(X), Y, n_jobs, loo_method, progress)
+
+    def fit_features(self, X_features, Y, n_jobs=None, loo_method=REFIT, progress=None):
+        # Fit on the feature matrix (#Trials, #Features) of _getFeatureMatrix, e.g. cached from a previous fit
         # Check which model is the best 
-        max_accs, best_model_idx = self.evaluate(X, Y)
+        max_accs, best_model_idx = self._evaluateFeatures(X_features, Y, n_jobs, loo_method, progress)
         print("max accuracy:", max_accs)
         print("best model index:", best_model_idx)
         self.mod_type = self.mod_types[best_model_idx]
         self.model = self.mod_type()
         
-        X_features = np.array([self._getFeatures(eeg_datas) for eeg_datas in X])
         X_features = self.scaler.fit_transform(X_features)
         X_features, self.feature_indx = self._selectTopFeatures(X_features, Y)
 
         self.model.fit(X_features,Y)
+        self.compiled = None # Compiled again for the new model on the next predict_proba_one
     
-    def evaluate(self, X, Y): 
-        unique_Y = np.unique(Y)
-        loo = LeaveOneOut()
-        X_features = np.array([self._getFeatures(eeg_datas) for eeg_datas in X])
-        accs = [] 
-        for mod in self.mod_types: 
-            y_pred = []
-            y_true = []
-            for train_ix, test_ix in loo.split(Y):
-                # split data
-                X_train_i, X_test_i = X_features[train_ix, :], X_features[test_ix, :]
-                y_train_i, y_test_i = Y[train_ix], Y[test_ix]
-
-                scaler = StandardScaler()
-                X_train_i = scaler.fit_transform(X_train_i)
-                X_train_i, feature_indx = self._selectTopFeatures(X_train_i, y_train_i)
-                
-                # fit model
-                model = mod()
-                model.fit(X_train_i, y_train_i)
-
-                X_test_i = scaler.transform(X_test_i)
-                X_test_i = np.transpose([X_test_i[:, i] for i in feature_indx])
-
-                # evaluate model
-                yhat = model.predict(X_test_i)
-                # store
-                y_true.append(y_test_i[0])
-                y_pred.append(yhat[0])
-
-            # calculate accuracy
-            acc = accuracy_score(y_true, y_pred)
-            accs.append(acc)
+    def evaluate(self, X, Y=None, n_jobs=None, loo_method=REFIT, progress=None): 
+        # Leave one out accuracy of every model in mod_types, returns the best accuracy and the index of its model
+        if isinstance(X, EpochSet):
+            X, Y = X.data, X.labels
+        # loo_method FAST gives the same LDA predictions as REFIT in a fraction of the time, which matters for long sessions
+        return self._evaluateFeatures(self._getFeatureMatrix(X), Y, n_jobs, loo_method, progress)
+
+    def _evaluateFeatures(self, X_features, Y, n_jobs=None, loo_method=REFIT, progress=None):
+        y_preds = self._getLeaveOneOutPredictions(X_features, Y, n_jobs, loo_method, progress)
+        accs = [accuracy_score(Y, y_pred) for y_pred in y_preds]
         #print(accs)
         return max(accs), accs.index(max(accs))
+
+    def _getLeaveOneOutPredictions(self, X_features, Y, n_jobs=None, loo_method=REFIT, progress=None):
+        # Prediction for every left out trial by every model, (#Models, #Trials)
+        # The (model, fold) pairs that are refit run on a thread pool of n_jobs threads, all cores by default
+        # progress(mod, #folds done, #folds) is called from the calling thread as the folds of each model finish
+        if loo_method not in LOO_METHODS:
+            raise ValueError("Unknown leave one out method: " + str(loo_method))
+        folds = self._getFolds(X_features, Y)
+        y_preds = np.empty((len(self.mod_types), len(Y)), dtype=np.asarray(Y).dtype)
+        jobs = []
+        for m, mod in enumerate(self.mod_types):
+            if loo_method == FAST and issubclass(mod, LinearDiscriminantAnalysis):
+                y_preds[m] = self._getLdaLeaveOneOutPredictions(X_features, Y, folds)
+                if progress is not None:
+                    progress(mod, len(folds), len(folds))
+            elif loo_method == FAST and issubclass(mod, LogisticRegression) and len(np.unique(Y)) == 2:
+                y_preds[m] = self._getWarmStartLeaveOneOutPredictions(mod, X_features, Y, folds)
+                if progress is not None:
+                    progress(mod, len(folds), len(folds))
+            else :
+                jobs.extend((m, mod, fold) for fold in folds)
+        folds_done = [0] * len(self.mod_types)
+        with ThreadPoolExecutor(max_workers=n_jobs if n_jobs is not None else os.cpu_count()) as executor:
+            for (m, mod, fold), y_pred in zip(jobs, executor.map(lambda job: self._predictFold(X_features, Y, *job[1:]), jobs)):
+                y_preds[m, fold[0]] = y_pred
+                folds_done[m] += 1
+                if progress is not None:
+                    progress(mod, folds_done[m], len(folds))
+        return y_preds
+
+    def _getFolds(self, X_features, Y):
+        # The scaler and the top features of every leave one out fold, as (test index, mean, scale, feature_indx).
+        # They only depend on the fold through the left out trial, so they are all downdated from the sums over
+        # every trial instead of refitting a StandardScaler and rerunning _selectTopFeatures on each fold
+        n = len(Y)
+        X_centered = X_features - np.mean(X_features, 0) # Centered so the sums of squares don't lose precision
+        means = (np.sum(X_centered, 0) - X_centered) / (n - 1)
+        variances = np.maximum((np.sum(X_centered ** 2, 0) - X_centered ** 2) / (n - 1) - means ** 2, 0)
+        scales = np.sqrt(variances)
+        scales[scales < 10 * np.finfo(float).eps] = 1 # Like StandardScaler, constant features are left unscaled
+        means += np.mean(X_features, 0)
+
+        # Mean and standard error of each class without the left out trial, as in _selectTopFeatures
+        class_means = []
+        class_errors = []
+        for un in np.unique(Y):
+            in_class = (Y == un)[:, np.newaxis]
+            n_class = np.sum(in_class) - in_class
+            class_mean = (np.sum(X_centered[in_class[:, 0]], 0) - X_centered * in_class) / n_class
+            class_variance = (np.sum(X_centered[in_class[:, 0]] ** 2, 0) - X_centered ** 2 * in_class) / n_class - class_mean ** 2
+            class_means.append(class_mean)
+            class_errors.append(np.sqrt(np.maximum(class_variance, 0)) / np.sqrt(n_class))
+        # Scaling divides the means and errors by the fold scale, the fold mean cancels out of the difference
+        mean_diffs = (np.abs(class_means[0] - class_means[1]) - np.sum(class_errors, 0)) / scales
+        feature_indxs = np.argsort(mean_diffs, 1)[:, ::-1][:, :self.num_top]
+        return list(zip(range(n), means, scales, feature_indxs))
+
+    def _getFoldData(self, X_features, Y, fold):
+        # Scaled top features of the training trials, their labels and the scaled top features of the left out trial
+        test_ix, mean, scale, feature_indx = fold
+        X_train_i = (np.delete(X_features, test_ix, 0)[:, feature_indx] - mean[feature_indx]) / scale[feature_indx]
+        X_test_i = (X_features[test_ix:test_ix + 1, feature_indx] - mean[feature_indx]) / scale[feature_indx]
+        return X_train_i, np.delete(Y, test_ix), X_test_i
+
+    def _predictFold(self, X_features, Y, mod, fold):
+        X_train_i, y_train_i, X_test_i = self._getFoldData(X_features, Y, fold)
+        model = mod()
+        model.fit(X_train_i, y_train_i)
+        return model.predict(X_test_i)[0]
+
+    def _getWarmStartLeaveOneOutPredictions(self, mod, X_features, Y, folds):
+        # Folds only differ by a trial, so each fit starts from the coefficients the previous folds found for its features
+        coefs = {}
+        intercept = 0
+        y_pred = []
+        for fold in folds:
+            X_train_i, y_train_i, X_test_i = self._getFoldData(X_features, Y, fold)
+            feature_indx = fold[3]
+            model = mod(warm_start=True)
+            model.coef_ = np.array([[coefs.get(i, 0.0) for i in feature_indx]])
+            model.intercept_ = np.array([intercept])
+            model.fit(X_train_i, y_train_i)
+            y_pred.append(model.predict(X_test_i)[0])
+            coefs.update(zip(feature_indx, model.coef_[0]))
+            intercept = model.intercept_[0]
+        return y_pred
+
+    def _getLdaLeaveOneOutPredictions(self, X_features, Y, folds, tol=1e-4):
+        # Exact leave one out predictions of LinearDiscriminantAnalysis (svd solver) for all folds at once. The class means
+        # and the within class scatter of all trials are downdated by the left out trial, then restricted to the fold's top
+        # features. LDA predictions don't change with the fold's scaling, so the unscaled features are used
+        Y = np.asarray(Y)
+        classes = np.unique(Y)
+        n, n_classes = len(Y), len(classes)
+        labels = np.searchsorted(classes, Y)
+        trials = np.arange(n)
+        feature_indxs = np.array([fold[3] for fold in folds])
+        X_centered = X_features - np.mean(X_features, 0)
+
+        counts = np.bincount(labels, minlength=n_classes)
+        class_means = np.array([np.mean(X_centered[labels == c], 0) for c in range(n_classes)])
+        residuals = X_centered - class_means[labels]
+        scatter = residuals.T @ residuals
+
+        # Rank one downdates of the class of every left out trial
+        fold_counts = np.tile(counts, (n, 1))
+        fold_counts[trials, labels] -= 1
+        fold_means = np.tile(class_means, (n, 1, 1))
+        fold_means[trials, labels] = (counts[labels, np.newaxis] * class_means[labels] - X_centered) / fold_counts[trials, labels, np.newaxis]
+        selected_residuals = np.take_along_axis(residuals, feature_indxs, 1)
+        fold_scatter = scatter[feature_indxs[:, :, np.newaxis], feature_indxs[:, np.newaxis, :]] \
+            - (counts[labels] / fold_counts[trials, labels])[:, np.newaxis, np.newaxis] * selected_residuals[:, :, np.newaxis] * selected_residuals[:, np.newaxis, :]
+        fold_means = np.take_along_axis(fold_means, feature_indxs[:, np.newaxis, :], 2)
+        x = np.take_along_axis(X_centered, feature_indxs, 1)
+
+        # Within class whitening like the svd solver: directions of the standardized covariance below tol are dropped
+        std = np.sqrt(np.diagonal(fold_scatter, axis1=1, axis2=2) / (n - 1))
+        std[std == 0] = 1
+        correlation = fold_scatter / (n - 1 - n_classes) / std[:, :, np.newaxis] / std[:, np.newaxis, :]
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        inverse_eigenvalues = np.where(eigenvalues > tol ** 2, 1 / np.where(eigenvalues > tol ** 2, eigenvalues, 1), 0)
+        metric = (eigenvectors * inverse_eigenvalues[:, np.newaxis, :]) @ eigenvectors.transpose(0, 2, 1)
+        metric = metric / std[:, :, np.newaxis] / std[:, np.newaxis, :]
+
+        # Discriminant of every class relative to the prior weighted mean, as in LinearDiscriminantAnalysis.decision_function
+        priors = fold_counts / (n - 1)
+        xbar = np.einsum('nc,nck->nk', priors, fold_means)
+        fold_means = fold_means - xbar[:, np.newaxis, :]
+        coefs = np.einsum('nck,nkj->ncj', fold_means, metric)
+        scores = np.einsum('nk,nck->nc', x - xbar, coefs) - 0.5 * np.einsum('nck,nck->nc', coefs, fold_means) + np.log(priors)
+        return classes[np.argmax(scores, 1)]
         
     def predict(self, X):
         # X shape must be (#Trials, #Chans, #Timepoints)
-        X_features = np.array([self._getFeatures(eeg_datas) for eeg_datas in X])
+        X_features = self._getFeatureMatrix(X)
         X_features = self.scaler.transform(X_features)
         X_features = np.transpose([X_features[:, i] for i in self.feature_indx])
         
@@ -163,8 +293,73 @@ class PowerBinModel(myModel):
 
     def predict_proba(self, X):
         # X shape must be (#Trials, #Chans, #Timepoints)
-        X_features = np.array([self._getFeatures(eeg_datas) for eeg_datas in X])
+        start = latency_monitor.now()
+        X_features = self._getFeatureMatrix(X)
+        latency_monitor.recordSince('features', start)
+        return self.predict_proba_features(X_features)
+
+    def predict_proba_features(self, X_features):
+        # X_features shape must be (#Trials, #Features), as from _getFeatures or combineFeatures
+        start = latency_monitor.now()
         X_features = self.scaler.transform(X_features)
         X_features = np.transpose([X_features[:, i] for i in self.feature_indx])
-        return self.model.predict_proba(X_features)
+        probas = self.model.predict_proba(X_features)
+        latency_monitor.recordSince('classifier', start)
+        return probas
+
+    ###########################
+    ## SINGLE WINDOW METHODS ##
+    ###########################
+    def compile(self):
+        '''
+            Fold the scaler mean and scale and the top feature selection into the weights of the linear model
+            (LogisticRegression or LinearDiscriminantAnalysis) for predict_proba_one and predict_proba_spectral
+        '''
+        n_chans, n_bins = len(self.chans), len(self.intervals)
+        indx = np.asarray(self.feature_indx)
+        weights = np.zeros((len(self.model.coef_), len(self.feat_names)))
+        weights[:, indx] = self.model.coef_ / self.scaler.scale_[indx]
+        intercept = self.model.intercept_ - weights[:, indx] @ self.scaler.mean_[indx]
+
+        # The hemisphere features are sums of the channel power ratios, so their weights move onto the channels
+        start = n_chans * n_bins + 2 * n_chans
+        left_weights, right_weights, difference_weights = [weights[:, start + i * n_bins:start + (i + 1) * n_bins] for i in range(3)]
+        left, right = getHemisphereMasks(tuple(self.chans))
+        ratio_weights = weights[:, :n_chans * n_bins].reshape(-1, n_chans, n_bins)
+        ratio_weights = ratio_weights + left[:, np.newaxis] * (left_weights + difference_weights)[:, np.newaxis, :] \
+                                      + right[:, np.newaxis] * (right_weights - difference_weights)[:, np.newaxis, :]
+        mobility_weights = weights[:, n_chans * n_bins:n_chans * n_bins + n_chans]
+        complexity_weights = weights[:, n_chans * n_bins + n_chans:start]
+
+        spectral_chans = np.flatnonzero(np.any(ratio_weights != 0, axis=(0, 2)))
+        hjorth_chans = np.flatnonzero(np.any((mobility_weights != 0) | (complexity_weights != 0), axis=0))
+        self.compiled = CompiledModel(intercept, ratio_weights, mobility_weights, complexity_weights, spectral_chans, hjorth_chans)
+        return self.compiled
+
+    def predict_proba_one(self, window):
+        # window shape must be (#Chans, #Timepoints), only the features the model uses are computed
+        compiled = getattr(self, 'compiled', None) or self.compile()
+        window = np.asarray(window)
+        scores = compiled.intercept.copy()
+        if len(compiled.spectral_chans):
+            ratios = getPowerRatios(window[compiled.spectral_chans], self.binning)
+            scores += np.einsum('ocb,cb->o', compiled.ratio_weights[:, compiled.spectral_chans], ratios)
+        if len(compiled.hjorth_chans):
+            mobs, comps = getHjorth(window[compiled.hjorth_chans])
+            scores += compiled.mobility_weights[:, compiled.hjorth_chans] @ mobs + compiled.complexity_weights[:, compiled.hjorth_chans] @ comps
+        return self._getProbas(scores)
+
+    def predict_proba_spectral(self, ratios, mobs, comps):
+        # Probabilities of one window from the power ratios (#Chans, #Bins) and Hjorth parameters (#Chans) of all its channels
+        compiled = getattr(self, 'compiled', None) or self.compile()
+        scores = compiled.intercept + np.einsum('ocb,cb->o', compiled.ratio_weights, ratios) \
+                 + compiled.mobility_weights @ mobs + compiled.complexity_weights @ comps
+        return self._getProbas(scores)
 
+    def _getProbas(self, scores):
+        # Like the predict_proba of sklearn's linear models: logistic for two classes, softmax otherwise
+        if len(scores) == 1:
+            proba = 1 / (1 + np.exp(-scores[0]))
+            return np.array([1 - proba, proba])
+        probas = np.exp(scores - np.max(scores))
+        return probas / np.sum(probas)
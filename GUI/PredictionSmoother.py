@@ -0,0 +1,48 @@
+import numpy as np
+
+# Smoothing kernels
+BOXCAR = 'boxcar' # Mean of the last window predictions
+EXPONENTIAL = 'exponential' # Exponential moving average with the same center of mass as the boxcar
+SMOOTHING_KERNELS = [BOXCAR, EXPONENTIAL]
+
+class PredictionSmoother:
+    """ Smooths a stream of predictions in O(1) per prediction.
+
+        The boxcar keeps a running sum over a small ring of the last window predictions and the
+        exponential kernel keeps a single running value. Both are updated on every prediction so
+        the kernel can be switched at any time without a warm up.
+    """
+    def __init__(self, window=2, kernel=BOXCAR, initial_value=0):
+        self.window = window
+        self.setKernel(kernel)
+        self.alpha = 2 / (window + 1)
+
+        self.values = np.full(window, float(initial_value))
+        self.index = 0
+        self.total = initial_value * window
+        self.exponential_value = initial_value
+        self.value = initial_value
+
+    def setKernel(self, kernel):
+        if kernel not in SMOOTHING_KERNELS:
+            raise ValueError("Unknown smoothing kernel: " + str(kernel))
+        self.kernel = kernel
+
+    def getValue(self):
+        if self.kernel == BOXCAR:
+            return self.total / self.window
+        return self.exponential_value
+
+    def update(self, value):
+        '''
+            Add a new prediction and return the smoothed value
+        '''
+        # Boxcar running sum, swapping the oldest prediction for the new one
+        self.total += value - self.values[self.index]
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.window
+        if self.index == 0:
+            self.total = np.sum(self.values) # Resync once per window so rounding errors can't accumulate
+
+        self.exponential_value += self.alpha * (value - self.exponential_value)
+        return self.getValue()
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_FS = 250
+DEFAULT_CHANNELS = [0, 1, 2, 3, 4, 5, 6, 7] # All 8 channels of cyton
+DEFAULT_BLOCK_SIZE = 10 # Samples delivered per callback, like a packet from a driver
+
+class ReplaySource:
+    """ Streams a recorded session (as written by EEGRecorder) to a callback in blocks of samples.
+
+        speed=1 follows the recorded timestamps, speed=2 replays twice as fast and speed=None replays
+        as fast as possible for benchmarks. Blocks are shaped (#samples, #board channels) like the
+        board samples EEGSampler.push_data_samples accepts, with the recorded values already in uV.
+        The recorded events are sent along with the samples, so EEGSampler.getEventHistory() lines them
+        up with the predictions made on the replayed session.
+    """
+    def __init__(self, eeg_filename, event_filename=None, channels=DEFAULT_CHANNELS, speed=1, block_size=DEFAULT_BLOCK_SIZE, fs=DEFAULT_FS):
+        self.fs = fs
+        self.speed = speed
+        self.block_size = block_size
+
+        eeg_df = pd.read_csv(eeg_filename)
+        self.timestamps = eeg_df.iloc[:, 0].values
+        recorded = eeg_df.iloc[:, 1:].values
+        # Columns are named after the board channels by EEGRecorder, otherwise they are assumed to be the given channels in order
+        try:
+            recorded_channels = [int(column) for column in eeg_df.columns[1:]]
+        except ValueError:
+            recorded_channels = list(channels)[:recorded.shape[1]]
+        self.samples = np.zeros((len(recorded), max(max(recorded_channels), max(channels)) + 1))
+        self.samples[:, recorded_channels] = recorded
+
+        # Events as (sample index, event name), e.g. (1200, 'start_1')
+        self.events = []
+        if event_filename is not None:
+            event_df = pd.read_csv(event_filename)
+            event_indices = np.searchsorted(self.timestamps, event_df.iloc[:, 0].values)
+            self.events = list(zip(event_indices, event_df.iloc[:, 1].values))
+
+        self.running = False
+        self.num_samples_replayed = 0
+        self.elapsed_seconds = 0
+
+    def run(self, callback, event_callback=None):
+        '''
+            Replay the session, calling callback(block) for every block of samples and
+            event_callback(event, sample_index) for every event once its sample has been replayed
+        '''
+        self.running = True
+        self.num_samples_replayed = 0
+        next_event = 0
+        start_time = time.perf_counter()
+        for start in range(0, len(self.samples), self.block_size):
+            if not self.running:
+                break
+            end = min(start + self.block_size, len(self.samples))
+            if self.speed is not None:
+                # Wait until the last sample of the block would have been recorded
+                wait = (self.timestamps[end - 1] - self.timestamps[0]) / self.speed - (time.perf_counter() - start_time)
+                if wait > 0:
+                    time.sleep(wait)
+            callback(self.samples[start:end])
+            self.num_samples_replayed = end
+            while event_callback is not None and next_event < len(self.events) and self.events[next_event][0] < end:
+                event_callback(self.events[next_event][1], self.events[next_event][0])
+                next_event += 1
+        self.elapsed_seconds = time.perf_counter() - start_time
+        self.running = False
+        throughput = self.getThroughput()
+        print("Replayed", self.num_samples_replayed, "samples in", round(self.elapsed_seconds, 3), "seconds:",
+              round(throughput['samples_per_second']), "samples/s,", round(throughput['realtime_factor'], 1), "x real time")
+
+    def stop(self):
+        self.running = False
+
+    def getThroughput(self):
+        '''
+            Samples per second and how many times faster than real time the last replay ran
+        '''
+        samples_per_second = self.num_samples_replayed / self.elapsed_seconds if self.elapsed_seconds > 0 else 0
+        return {'samples_per_second': samples_per_second, 'realtime_factor': samples_per_second / self.fs}
+
+
+if __name__ == "__main__":
+    # Benchmark the sampler pipeline by replaying a recorded session as fast as possible
+    import pickle
+    import sys
+    from EEGSampler import EEGSampler
+    from InferenceWorker import BLOCK
+
+    eeg_filename = sys.argv[1] if len(sys.argv) > 1 else "./data/eeg_data.csv"
+    event_filename = sys.argv[2] if len(sys.argv) > 2 else None
+    with open("PowerBinModel.pkl", 'rb') as file:
+        model = pickle.load(file)
+    channels = [4, 5, 6, 7]
+    # Every prediction is made, so the results match a real time replay of the same session
+    eeg_sampler = EEGSampler(False, channels=channels, model=model, overload_policy=BLOCK)
+    replay_source = ReplaySource(eeg_filename, event_filename, channels=channels, speed=None)
+    eeg_sampler.inference_worker.start()
+    replay_source.run(eeg_sampler.push_data_samples, eeg_sampler.push_event)
+    eeg_sampler.inference_worker.stop()
+    print("Made", len(eeg_sampler.getPredictionHistory()), "predictions over", len(eeg_sampler.getEventHistory()), "events")
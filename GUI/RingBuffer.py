@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class RingBuffer:
+    """ Preallocated circular buffer of samples with an O(1) append.
+
+        Every sample is written twice, at the cursor and one capacity further along, so the
+        latest samples are always one contiguous slice of the storage. getLatest() returns
+        that slice as a read-only view ordered newest-first (index 0 is the newest sample),
+        which is the same ordering the np.roll based buffers used.
+
+        The storage and the [cursor, count] state can be passed in, e.g. views into shared memory,
+        so another process can read the buffer.
+    """
+    def __init__(self, capacity, sample_shape=(), dtype=float, data=None, state=None):
+        self.capacity = capacity
+        self.sample_shape = tuple(sample_shape)
+        self.data = np.zeros((2 * capacity,) + self.sample_shape, dtype=dtype) if data is None else data
+        self.state = np.zeros(2, dtype=np.int64) if state is None else state
+
+    # Index of the newest sample
+    @property
+    def cursor(self):
+        return int(self.state[0])
+    @cursor.setter
+    def cursor(self, value):
+        self.state[0] = value
+
+    # Total number of samples appended
+    @property
+    def count(self):
+        return int(self.state[1])
+    @count.setter
+    def count(self, value):
+        self.state[1] = value
+
+    def append(self, sample):
+        '''
+            Add a single sample as the newest entry of the buffer
+        '''
+        self.cursor = (self.cursor - 1) % self.capacity
+        self.data[self.cursor] = sample
+        self.data[self.cursor + self.capacity] = sample
+        self.count += 1
+
+    def extend(self, samples):
+        '''
+            Add a block of samples, ordered oldest first, in one copy
+        '''
+        self.count += len(samples)
+        samples = samples[-self.capacity:]
+        self.cursor = (self.cursor - len(samples)) % self.capacity
+        self.setLatest(samples[::-1])
+
+    def getNewest(self):
+        return self.data[self.cursor]
+
+    def getLatest(self, n=None):
+        '''
+            Zero-copy view of the n newest samples, newest first
+        '''
+        if n is None:
+            n = self.capacity
+        if n > self.capacity:
+            raise ValueError("Requested " + str(n) + " samples from a buffer of capacity " + str(self.capacity))
+        view = self.data[self.cursor : self.cursor + n]
+        view.flags.writeable = False
+        return view
+
+    def setLatest(self, values):
+        '''
+            Overwrite the len(values) newest samples, values are ordered newest first
+        '''
+        n = len(values)
+        self.data[self.cursor : self.cursor + n] = values
+        # Keep the mirrored half of the storage in sync
+        head = min(n, self.capacity - self.cursor)
+        self.data[self.cursor + self.capacity : self.cursor + self.capacity + head] = values[:head]
+        self.data[:n - head] = values[head:]
@@ -0,0 +1,144 @@
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from RingBuffer import RingBuffer
+
+
+# Consistent copy of the latest samples, ordered oldest first, with the index of every sample since the stream started
+Snapshot = namedtuple('Snapshot', ['eeg', 'predictions', 'prediction_averages', 'sample_indices'])
+
+NUM_COUNTERS = 8 # Seqlock sequence, [cursor, count] of each of the three ring buffers, then the sample index of the latest prediction
+NUM_VALUES = 3 # Latest prediction, latest averaged prediction and the time.perf_counter() time it was published
+SNAPSHOT_TIMEOUT_SECONDS = 0.1 # How long getSnapshot retries reads torn by the writer before it returns the previous snapshot
+
+class SamplerMemory:
+    """ The buffers and latest predictions an EEGSampler publishes to its readers.
+
+        Everything lives in one flat block of memory: a plain bytearray by default, or a
+        multiprocessing.shared_memory block when shared, so that another process can attach to it
+        by name. Readers use getSnapshot(), which is guarded by the sequence counter the writer
+        makes odd while a block of samples is being written.
+    """
+    def __init__(self, capacity, n_chans, shared=False, name=None, read_only=False):
+        self.capacity = capacity
+        self.n_chans = n_chans
+        size = 8 * (NUM_COUNTERS + NUM_VALUES + 2 * capacity * (n_chans + 2))
+        self.owner = shared and name is None
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+        elif shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else :
+            self.shm = None
+        self.name = self.shm.name if self.shm is not None else None
+        memory = self.shm.buf if self.shm is not None else bytearray(size)
+
+        # Lay out the counters, values and ring buffer storage in the block
+        self.counters = np.frombuffer(memory, dtype=np.int64, count=NUM_COUNTERS)
+        offset = 8 * NUM_COUNTERS
+        self.values = np.frombuffer(memory, dtype=np.float64, count=NUM_VALUES, offset=offset)
+        offset += 8 * NUM_VALUES
+        buffer_data = np.frombuffer(memory, dtype=np.float64, count=2 * capacity * n_chans, offset=offset).reshape(2 * capacity, n_chans)
+        offset += 8 * 2 * capacity * n_chans
+        pred_data = np.frombuffer(memory, dtype=np.float64, count=2 * capacity, offset=offset)
+        offset += 8 * 2 * capacity
+        average_data = np.frombuffer(memory, dtype=np.float64, count=2 * capacity, offset=offset)
+        if read_only:
+            for array in (self.counters, self.values, buffer_data, pred_data, average_data):
+                array.flags.writeable = False
+
+        self.buffer = RingBuffer(capacity, (n_chans,), data=buffer_data, state=self.counters[1:3])
+        self.pred_values = RingBuffer(capacity, data=pred_data, state=self.counters[3:5])
+        self.pred_values_average = RingBuffer(capacity, data=average_data, state=self.counters[5:7])
+
+        self.snapshot = None
+        self.snapshot_key = None
+
+    # Seqlock counter, odd while the writer is updating the buffers
+    @property
+    def sequence(self):
+        return int(self.counters[0])
+    @sequence.setter
+    def sequence(self, value):
+        self.counters[0] = value
+
+    @property
+    def prediction(self):
+        return float(self.values[0])
+    @prediction.setter
+    def prediction(self, value):
+        self.values[0] = value
+
+    @property
+    def prediction_index(self):
+        return int(self.counters[7])
+    @prediction_index.setter
+    def prediction_index(self, value):
+        self.counters[7] = value
+
+    @property
+    def prediction_average(self):
+        return float(self.values[1])
+    @prediction_average.setter
+    def prediction_average(self, value):
+        self.values[1] = value
+
+    @property
+    def prediction_time(self):
+        return float(self.values[2])
+    @prediction_time.setter
+    def prediction_time(self, value):
+        self.values[2] = value
+
+    def getSnapshot(self, n_samples=None):
+        '''
+            Consistent read-only copy of the n_samples latest samples and predictions. The writer
+            is never blocked, and the previous snapshot is returned as is when no samples have
+            arrived since it was taken. If no consistent copy can be read within SNAPSHOT_TIMEOUT_SECONDS,
+            e.g. because the writer died midway through a block, the previous snapshot is returned
+            too, so a reader on the GUI thread can never hang here.
+        '''
+        if n_samples is None:
+            n_samples = self.capacity
+        deadline = time.perf_counter() + SNAPSHOT_TIMEOUT_SECONDS
+        while time.perf_counter() < deadline:
+            sequence = self.sequence
+            if self.snapshot_key == (sequence, n_samples):
+                return self.snapshot
+            if sequence % 2 == 1:
+                time.sleep(0) # The writer is midway through a block, let it finish
+                continue
+            snapshot = self.__copyLatest(n_samples)
+            if self.sequence == sequence:
+                self.snapshot = snapshot
+                self.snapshot_key = (sequence, n_samples)
+                return snapshot
+        if self.snapshot is not None:
+            return self.snapshot
+        return self.__copyLatest(n_samples) # Nothing consistent was ever read, the best there is
+
+    def __copyLatest(self, n_samples):
+        eeg = self.buffer.getLatest(n_samples)[::-1].copy()
+        predictions = self.pred_values.getLatest(n_samples)[::-1].copy()
+        prediction_averages = self.pred_values_average.getLatest(n_samples)[::-1].copy()
+        count = self.buffer.count
+        sample_indices = np.arange(count - n_samples, count)
+        for array in (eeg, predictions, prediction_averages, sample_indices):
+            array.flags.writeable = False
+        return Snapshot(eeg, predictions, prediction_averages, sample_indices)
+
+    def close(self):
+        '''
+            Release the shared memory block, which is removed once its creator closes it
+        '''
+        if self.shm is not None:
+            # The views into the block have to go before it can be closed
+            self.counters = self.values = self.buffer = self.pred_values = self.pred_values_average = None
+            self.snapshot = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
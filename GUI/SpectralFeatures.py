@@ -0,0 +1,147 @@
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_FS = 250
+BIN_CACHE_SIZE = 16 # Number of (binning, fs, #timepoints) bin matrices kept
+
+
+@lru_cache(maxsize=BIN_CACHE_SIZE)
+def _getBinMatrix(binning, fs, n_time):
+    # pyeeg.bin_power sums the magnitudes of the full FFT over [floor(f/fs*n), floor(next_f/fs*n)).
+    # A full FFT index k above n/2 has the magnitude of rfft index n-k, so every full FFT index is
+    # counted onto its rfft index and the band sums become one matrix product.
+    bin_matrix = np.zeros((n_time // 2 + 1, len(binning) - 1))
+    for i in range(len(binning) - 1):
+        start = int(np.floor(float(binning[i]) / fs * n_time))
+        stop = int(np.floor(float(binning[i + 1]) / fs * n_time))
+        indices = np.arange(start, stop)
+        indices = np.where(indices > n_time // 2, n_time - indices, indices)
+        np.add.at(bin_matrix[:, i], indices, 1)
+    bin_matrix.flags.writeable = False
+    return bin_matrix
+
+def getBinMatrix(binning, fs=DEFAULT_FS, n_time=None):
+    '''
+        (#rfft bins, #bands) matrix that sums rfft magnitudes into the bands of binning
+    '''
+    return _getBinMatrix(tuple(binning), fs, n_time)
+
+def getBinPowers(eeg_datas, binning, fs=DEFAULT_FS):
+    '''
+        Band powers of pyeeg.bin_power for eeg_datas shaped (..., #timepoints), e.g. (#windows, #chans, #timepoints),
+        from a single rfft over the whole array. Returns (..., #bands)
+    '''
+    eeg_datas = np.asarray(eeg_datas, dtype=float)
+    magnitudes = np.abs(np.fft.rfft(eeg_datas, axis=-1))
+    return magnitudes @ getBinMatrix(binning, fs, eeg_datas.shape[-1])
+
+def getPowerRatios(eeg_datas, binning, fs=DEFAULT_FS):
+    '''
+        Band power ratios of pyeeg.bin_power for eeg_datas shaped (..., #timepoints). Returns (..., #bands)
+    '''
+    powers = getBinPowers(eeg_datas, binning, fs)
+    return powers / np.sum(powers, axis=-1, keepdims=True)
+
+def getHjorth(eeg_datas):
+    '''
+        Hjorth mobility and complexity of pyeeg.hjorth for eeg_datas shaped (..., #timepoints),
+        each returned shaped (...)
+    '''
+    eeg_datas = np.asarray(eeg_datas, dtype=float)
+    n_time = eeg_datas.shape[-1]
+    # pyeeg's first difference starts with the first sample itself
+    diffs = np.diff(eeg_datas, axis=-1, prepend=0)
+    m2 = np.sum(diffs ** 2, axis=-1) / n_time
+    total_power = np.sum(eeg_datas ** 2, axis=-1)
+    m4 = np.sum(np.diff(diffs, axis=-1) ** 2, axis=-1) / n_time
+    return np.sqrt(m2 / total_power), np.sqrt(m4 * total_power / m2 / m2)
+
+
+class SlidingSpectrum:
+    """ Band power ratios and Hjorth parameters of a window sliding over a multi-channel stream, updated incrementally.
+
+        Only the DFT bins that fall in the bands of binning are tracked. When the window slides by m
+        samples every tracked bin k is updated with the sliding DFT
+            X_k <- e^(j2pi*k*m/N) * (X_k + sum_i (new_i - old_i) * e^(-j2pi*k*i/N))
+        and the Hjorth sums with the samples that entered and left the window, so a hop costs time in
+        proportion to m instead of a full FFT of the window. Everything is recomputed from scratch
+        every resync_samples samples so rounding errors can't build up, and whenever the window
+        doesn't overlap the previous one. The features match getPowerRatios and getHjorth of the windows,
+        which are ordered newest sample first when newest_first, like the windows EEGSampler predicts on.
+    """
+    def __init__(self, n_time, binning, fs=DEFAULT_FS, resync_samples=None, newest_first=False):
+        self.n_time = n_time
+        self.newest_first = newest_first
+        self.binning = list(binning)
+        self.fs = fs
+        self.resync_samples = resync_samples if resync_samples is not None else n_time
+        bin_matrix = getBinMatrix(binning, fs, n_time)
+        self.bins = np.flatnonzero(np.any(bin_matrix != 0, axis=1)) # The rfft bins some band uses
+        self.bin_matrix = bin_matrix[self.bins]
+        self.twiddles = {} # e^(-j2pi*k*i/N) for i < m and the rotation e^(j2pi*k*m/N), per hop size m
+        self.reset()
+
+    def reset(self):
+        self.window = None
+        self.window_end = None
+        self.samples_since_resync = 0
+
+    def update(self, window, window_end):
+        '''
+            Slide to window, shaped (#chans, n_time), whose last sample has sample index window_end in the stream.
+            Returns the power ratios (#chans, #bands), mobility (#chans) and complexity (#chans)
+        '''
+        window = np.asarray(window, dtype=float)
+        if self.newest_first:
+            window = window[:, ::-1] # The window is tracked oldest sample first
+        shift = window_end - self.window_end if self.window is not None else 0
+        if self.window is None or window.shape != self.window.shape or shift < 0 or shift > self.n_time - 2 \
+                or self.samples_since_resync + shift > self.resync_samples:
+            self.__compute(window)
+        elif shift > 0:
+            self.__slide(window, shift)
+        self.window = window
+        self.window_end = window_end
+        return self.getFeatures()
+
+    def getFeatures(self):
+        powers = np.abs(self.spectrum) @ self.bin_matrix
+        ratios = powers / powers.sum(-1, keepdims=True)
+        # pyeeg's first difference starts with the first sample, which adds the edge terms of the window
+        if self.newest_first:
+            first, second = self.window[:, -1], self.window[:, -2]
+        else :
+            first, second = self.window[:, 0], self.window[:, 1]
+        m2 = (first ** 2 + self.diff_power) / self.n_time
+        m4 = ((second - 2 * first) ** 2 + self.second_diff_power) / self.n_time
+        return ratios, np.sqrt(m2 / self.total_power), np.sqrt(m4 * self.total_power / m2 / m2)
+
+    ############################
+    ## PRIVATE HELPER METHODS ##
+    ############################
+    def __compute(self, window):
+        self.spectrum = np.fft.rfft(window, axis=-1)[:, self.bins]
+        self.total_power = np.sum(window ** 2, axis=-1)
+        self.diff_power = np.sum(np.diff(window, axis=-1) ** 2, axis=-1)
+        self.second_diff_power = np.sum(np.diff(window, 2, axis=-1) ** 2, axis=-1)
+        self.samples_since_resync = 0
+
+    def __slide(self, window, shift):
+        if shift not in self.twiddles:
+            self.twiddles[shift] = (np.exp(-2j * np.pi * np.outer(np.arange(shift), self.bins) / self.n_time),
+                                    np.exp(2j * np.pi * self.bins * shift / self.n_time))
+        twiddle, rotation = self.twiddles[shift]
+        old = self.window[:, :shift]
+        new = window[:, -shift:]
+        self.spectrum = (self.spectrum + (new - old) @ twiddle) * rotation
+
+        # Sums of squares of the samples and differences that entered the window minus those that left it,
+        # the ones that left start in the previous window and the ones that entered end in the new one
+        edges = np.stack((window[:, -shift - 2:], self.window[:, :shift + 2]))
+        diffs = edges[..., 1:] - edges[..., :-1]
+        second_diffs = diffs[..., 1:] - diffs[..., :-1]
+        self.total_power += (new * new).sum(-1) - (old * old).sum(-1)
+        self.diff_power += (diffs[0, :, 1:] ** 2).sum(-1) - (diffs[1, :, :-1] ** 2).sum(-1)
+        self.second_diff_power += (second_diffs[0] ** 2).sum(-1) - (second_diffs[1] ** 2).sum(-1)
+        self.samples_since_resync += shift
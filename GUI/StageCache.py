@@ -0,0 +1,64 @@
+import os
+import pickle
+import hashlib
+
+CACHE_VERSION = 1 # Bump when a stage computes something different, so results cached before are not reused
+HASH_CHUNK_BYTES = 1 << 20
+
+
+class StageCache:
+    """ On-disk cache of the outputs of the training pipeline stages, e.g. the filtered signal, epochs,
+        feature matrix and fitted model.
+
+        Every output is pickled under a key hashed from everything the stage depends on: the contents of
+        its input files, its parameters and the keys of the stages it takes its input from. A stage whose
+        inputs haven't changed is loaded instead of computed, and a stage that is loaded never needs the
+        stages before it. With directory None nothing is cached and every stage is computed.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.file_hashes = {} # Content hash of every input file by (path, size, mtime), so a file is only read once
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def getFileHash(self, filename):
+        '''
+            sha256 of the contents of filename
+        '''
+        stat = os.stat(filename)
+        file_id = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self.file_hashes:
+            sha = hashlib.sha256()
+            with open(filename, 'rb') as file:
+                for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b''):
+                    sha.update(chunk)
+            self.file_hashes[file_id] = sha.hexdigest()
+        return self.file_hashes[file_id]
+
+    def getKey(self, stage, *params):
+        '''
+            Key of a stage from its parameters, which are file hashes, keys of other stages or plain values
+            (numbers, strings, lists, tuples, dicts) whose repr identifies them
+        '''
+        return hashlib.sha256(repr((CACHE_VERSION, stage) + params).encode()).hexdigest()
+
+    def getOrCompute(self, stage, key, compute):
+        '''
+            The cached output of stage under key, or compute() which is then cached
+        '''
+        if self.directory is None:
+            return compute()
+        filename = os.path.join(self.directory, stage + "_" + key + ".pkl")
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'rb') as file:
+                    return pickle.load(file)
+            except Exception as e:
+                print("Recomputing " + stage + ", its cache could not be read:", e)
+        value = compute()
+        # Written to a temporary file first so an interrupted write is never loaded
+        temp_filename = filename + "." + str(os.getpid()) + ".tmp"
+        with open(temp_filename, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, filename)
+        return value
@@ -0,0 +1,31 @@
+import numpy as np
+from scipy.signal import sosfilt
+
+from DataProcessingHelper import getFilterDesign
+
+
+class StreamingFilter:
+    """ Causal bandpass + 60 Hz bandstop for a stream of multi-channel EEG samples.
+
+        The per-channel filter state is carried between calls, so each call only filters the
+        samples that arrived since the previous one and the output continues seamlessly.
+    """
+    def __init__(self, n_chans, fs=250, f_range=(0.5, 50), notch_range=(58, 62), order=2):
+        self.fs = fs
+        self.f_range = f_range
+        self.notch_range = notch_range
+        bandpass = getFilterDesign(fs, f_range, order)
+        bandstop = getFilterDesign(fs, notch_range, order, pass_type='bandstop')
+        self.sos = np.concatenate((bandpass, bandstop))
+        # sosfilt state for filtering along the time axis of (#samples, #chans) blocks
+        self.zi = np.zeros((len(self.sos), 2, n_chans))
+
+    def process(self, samples):
+        '''
+            Filter a block of samples shaped (#samples, #chans) ordered oldest first
+        '''
+        filtered, self.zi = sosfilt(self.sos, samples, axis=0, zi=self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi[:] = 0
@@ -0,0 +1,20 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from AcquisitionProcess import AcquisitionProcess
+
+
+def test_latency_stats_come_from_the_acquisition_process():
+    acquisition_process = AcquisitionProcess(False, channels=[0, 1, 2, 3])
+    assert acquisition_process.getLatencyStats() is None
+    acquisition_process.startStream()
+    try:
+        time.sleep(0.5)
+        stats = acquisition_process.getLatencyStats(timeout=5)
+        assert stats['counters']['samples'] > 0 # Counted by the sampler streaming artificial data in the other process
+        assert 'filter' in stats['stages']
+        assert acquisition_process.getLatencyStats(timeout=5)['counters']['samples'] >= stats['counters']['samples']
+    finally:
+        acquisition_process.close()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from DCEstimator import DCEstimator
+
+
+# The exponential moving average one sample at a time, starting from the first sample
+def loopDCRemoval(signal, alpha):
+    mean = np.array(signal[0], dtype=float)
+    output = np.empty_like(signal)
+    for i, sample in enumerate(signal):
+        mean = alpha * sample + (1 - alpha) * mean
+        output[i] = sample - mean
+    return output
+
+def test_blocks_match_one_call_over_the_whole_signal():
+    rng = np.random.RandomState(0)
+    signal = rng.randn(5000, 4).cumsum(0) + 100 * np.arange(1, 5)
+    expected = DCEstimator(4).process(signal)
+    np.testing.assert_allclose(expected, loopDCRemoval(signal, DCEstimator(4).alpha), rtol=1e-9, atol=1e-9)
+
+    # Uneven blocks, from single samples to more than a second of data
+    bounds = np.cumsum(rng.choice([1, 3, 10, 33, 250, 500], size=len(signal)))
+    bounds = np.concatenate(([0], bounds[bounds < len(signal)], [len(signal)]))
+    dc_estimator = DCEstimator(4)
+    output = np.concatenate([dc_estimator.process(signal[start:end]) for start, end in zip(bounds[:-1], bounds[1:])])
+    np.testing.assert_allclose(output, expected, rtol=1e-9, atol=1e-9)
+
+def test_first_sample_sets_the_offset():
+    dc_estimator = DCEstimator(2)
+    np.testing.assert_array_equal(dc_estimator.process(np.array([[5.0, -3.0]])), [[0, 0]])
+    dc_estimator.reset()
+    np.testing.assert_array_equal(dc_estimator.process(np.array([[1.0, 2.0]] * 3)), np.zeros((3, 2)))
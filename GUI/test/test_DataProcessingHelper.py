@@ -0,0 +1,103 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from neurodsp import filt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from DataProcessingHelper import filterEEG, bandpass_bandstop_filter, notchFilter, getFilteredEpochs, getEEGEpochs, getOutputLabelsAndEpochTimes
+
+
+FS = 250
+EDGE = 126 # Samples at each edge that neurodsp's 1 second bandstop sets to NaN at 250 Hz
+
+def getSignal(n_samples=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    t = np.arange(n_samples) / FS
+    return np.cumsum(rng.randn(n_samples)) + 20 * np.sin(2 * np.pi * 60 * t) + 5 * np.sin(2 * np.pi * 10 * t)
+
+# The previous implementations, built on neurodsp's filter_signal
+def oldFilterEEG(eeg_data, fs=FS, f_range=(1, 50)):
+    sig_filt = filt.filter_signal(eeg_data, fs, 'bandpass', f_range, filter_type='iir', butterworth_order=2)
+    test_sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
+    num_nans = sum(np.isnan(test_sig_filt))
+    sig_filt = np.concatenate(([0]*(num_nans // 2), sig_filt, [0]*(num_nans // 2)))
+    sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
+    return sig_filt[~np.isnan(sig_filt)]
+
+def oldBandpassBandstopFilter(data, fs=FS):
+    sig_filt = filt.filter_signal(data, fs, 'bandpass', (1, 50), filter_type='iir', butterworth_order=2)
+    sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
+    return sig_filt[~np.isnan(sig_filt)]
+
+
+def test_notch_keeps_length_without_nans():
+    sig = getSignal()
+    notched = notchFilter(sig, FS)
+    assert notched.shape == sig.shape
+    assert not np.any(np.isnan(notched))
+
+def test_notch_matches_neurodsp_bandstop_on_central_region():
+    sig = getSignal()
+    expected = filt.filter_signal(sig, FS, 'bandstop', (58, 62), n_seconds=1)
+    np.testing.assert_allclose(notchFilter(sig, FS)[EDGE:-EDGE], expected[EDGE:-EDGE], rtol=1e-10, atol=1e-8)
+
+def test_filterEEG_matches_previous_output():
+    sig = getSignal()
+    np.testing.assert_allclose(filterEEG(sig, FS), oldFilterEEG(sig), rtol=1e-10, atol=1e-8)
+
+def test_bandpass_bandstop_filter_matches_previous_output_on_central_region():
+    sig = getSignal()
+    filtered = bandpass_bandstop_filter(sig, FS)
+    assert filtered.shape == sig.shape
+    np.testing.assert_allclose(filtered[EDGE:-EDGE], oldBandpassBandstopFilter(sig), rtol=1e-10, atol=1e-8)
+
+def test_filtering_along_an_axis_matches_filtering_each_channel():
+    channels = np.stack([getSignal(seed=seed) for seed in range(4)], axis=1) # (#timepoints, #channels)
+    expected = np.stack([filterEEG(channels[:, i], FS) for i in range(4)], axis=1)
+    np.testing.assert_allclose(filterEEG(channels, FS, axis=0), expected, rtol=1e-10, atol=1e-8)
+
+    epochs = channels.T.reshape(4, 2, -1) # (#trials, #channels, #timepoints)
+    expected = np.array([[bandpass_bandstop_filter(channel, FS) for channel in epoch] for epoch in epochs])
+    np.testing.assert_allclose(getFilteredEpochs(epochs), expected, rtol=1e-10, atol=1e-8)
+
+# The previous getEEGEpochs, masking the whole recording for every epoch
+def oldGetEEGEpochs(epoch_times, eeg_df, eeg_chans, target_num_trials=1000):
+    eeg_epochs = []
+    for epoch_time in epoch_times:
+        baseline_df = eeg_df[(eeg_df['time'] > (epoch_time[0] - 1.5)) & (eeg_df['time'] < ((epoch_time[0])))]
+        baselines = np.mean(baseline_df[eeg_chans].values, 0)
+        sub_df = eeg_df[(eeg_df['time'] > epoch_time[0]) & (eeg_df['time'] < epoch_time[1])].drop(columns=['time'])
+        sub_df = sub_df - baselines
+        num_above = len(sub_df) - target_num_trials
+        if num_above >= 0:
+            eeg_epochs.append(np.array(sub_df.values[num_above // 2: len(sub_df) - num_above // 2])[:1000].T)
+    return np.array(eeg_epochs)
+
+def test_getEEGEpochs_matches_previous_output():
+    rng = np.random.RandomState(0)
+    n_samples = FS * 300
+    chans = ['C4', 'C2', 'C1', 'C3']
+    eeg_df = pd.DataFrame(dict({'time': np.arange(n_samples) / FS + 0.0013}, **{ch: rng.randn(n_samples) for ch in chans}))
+    # Trials of even and odd numbers of samples above 1000, and ones too short to keep
+    starts = np.sort(rng.uniform(2, 290, 50))
+    epoch_times = np.stack((starts, starts + rng.choice([4.0, 4.004, 4.012, 3.5], 50)), axis=1)
+    expected = oldGetEEGEpochs(epoch_times, eeg_df, chans)
+    eeg_epochs = getEEGEpochs(epoch_times, eeg_df, chans)
+    assert eeg_epochs.shape == expected.shape
+    np.testing.assert_allclose(eeg_epochs, expected, rtol=1e-10, atol=1e-10)
+
+def getEventDF(events):
+    return pd.DataFrame({'time': np.arange(len(events)) * 4.0, 'EventStart': events})
+
+def test_getOutputLabelsAndEpochTimes_pairs_start_and_end_events():
+    output_labels, epoch_times = getOutputLabelsAndEpochTimes(getEventDF(['start_1', 'end_1', 'start_2', 'end_2', 'start_4']))
+    np.testing.assert_array_equal(output_labels, [1, 2]) # The last trial never ended
+    np.testing.assert_array_equal(epoch_times, [[0, 4], [8, 12]])
+
+def test_getOutputLabelsAndEpochTimes_rejects_unmatched_events():
+    for events in (['start_1', 'start_1', 'end_1'], ['end_1', 'start_1', 'end_1'], ['start_1', 'end_2']):
+        with pytest.raises(ValueError):
+            getOutputLabelsAndEpochTimes(getEventDF(events))
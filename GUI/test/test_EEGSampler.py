@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from EEGSampler import EEGSampler, DEFAULT_UPDATE_SECONDS, DEFAULT_TIMEPOINTS_TO_CHOP
+from InferenceWorker import BLOCK
+from PowerBinModel import PowerBinModel
+
+
+CHANS = ['C4', 'C2', 'C1', 'C3']
+FS = 250
+
+def getModel():
+    rng = np.random.RandomState(0)
+    X = rng.randn(20, len(CHANS), 4 * FS).cumsum(-1)
+    Y = np.array([1, 2] * 10)
+    model = PowerBinModel(CHANS, num_top=8)
+    model.fit(X, Y)
+    return model
+
+def replayInBlocks(model, recording, block_size):
+    eeg_sampler = EEGSampler(False, channels=list(range(len(CHANS))), model=model, overload_policy=BLOCK)
+    eeg_sampler.inference_worker.start()
+    for start in range(0, len(recording), block_size):
+        eeg_sampler.push_data_samples(recording[start:start + block_size])
+    eeg_sampler.inference_worker.stop()
+    return eeg_sampler.getPredictionHistory()
+
+
+def test_predictions_do_not_depend_on_the_block_size():
+    # Predictions are scheduled by sample count, so however the samples arrive every hop gives the same window
+    recording = np.random.RandomState(1).randn(20 * FS, len(CHANS)).cumsum(0)
+    model = getModel()
+    expected = replayInBlocks(model, recording, 1)
+    assert len(expected) > 20
+    # Every window ends timepoints_to_chop samples before a hop
+    hop_samples = int(DEFAULT_UPDATE_SECONDS * FS)
+    assert all((window_end + 1 + DEFAULT_TIMEPOINTS_TO_CHOP) % hop_samples == 0 for window_end, _ in expected)
+    for block_size in (10, 33, 500):
+        assert replayInBlocks(model, recording, block_size) == expected
+
+def test_zero_update_seconds_predicts_every_sample():
+    recording = np.random.RandomState(2).randn(5 * FS, len(CHANS)).cumsum(0)
+    eeg_sampler = EEGSampler(False, channels=list(range(len(CHANS))), update_seconds=0, model=getModel(), overload_policy=BLOCK)
+    assert eeg_sampler.hop_samples == 1
+    assert eeg_sampler.smoother.window == FS # Still averaged over about a second of predictions
+    eeg_sampler.inference_worker.start()
+    eeg_sampler.push_data_samples(recording)
+    eeg_sampler.inference_worker.stop()
+    window_ends = [window_end for window_end, _ in eeg_sampler.getPredictionHistory()]
+    assert len(window_ends) > 0 and np.all(np.diff(window_ends) == 1)
+
+def test_failed_block_leaves_the_sequence_even():
+    eeg_sampler = EEGSampler(False, channels=list(range(len(CHANS))))
+    eeg_sampler.push_data_samples(np.zeros((10, len(CHANS))))
+    with pytest.raises(ValueError):
+        eeg_sampler.push_data_samples(np.full((10, len(CHANS)), 'not a number'))
+    assert eeg_sampler.memory.sequence % 2 == 0
+    eeg_sampler.push_data_samples(np.ones((5, len(CHANS))))
+    # The failed block never made it into the buffer
+    np.testing.assert_array_equal(eeg_sampler.getSnapshot(5).sample_indices, np.arange(10, 15))
+
+def test_replayed_events_line_up_with_the_stream(tmp_path):
+    from ReplaySource import ReplaySource
+    n_samples = 200
+    eeg_filename = str(tmp_path / 'eeg_data.csv')
+    event_filename = str(tmp_path / 'event_data.csv')
+    recording = np.random.RandomState(4).randn(n_samples, len(CHANS))
+    pd.DataFrame(np.column_stack((np.arange(n_samples) / FS, recording)), columns=['timestamp'] + list(range(len(CHANS)))).to_csv(eeg_filename, index=False)
+    pd.DataFrame([(40 / FS, 'start_1'), (150 / FS, 'end_1')], columns=['timestamp', 'event']).to_csv(event_filename, index=False)
+
+    replay_source = ReplaySource(eeg_filename, event_filename, channels=list(range(len(CHANS))), speed=None)
+    eeg_sampler = EEGSampler(False, channels=list(range(len(CHANS))), replay_source=replay_source)
+    eeg_sampler.startStream()
+    eeg_sampler.eeg_thread.join()
+    eeg_sampler.end()
+    assert eeg_sampler.getEventHistory() == [(40, 'start_1'), (150, 'end_1')]
+    assert eeg_sampler.buffer.count == n_samples
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from EpochSet import EpochSet
+
+
+CHANS = ['C4', 'C2', 'C1', 'C3']
+
+def getEpochSet():
+    rng = np.random.RandomState(0)
+    labels = np.array([2, 1, 4, 1, 2, 3, 1, 2])
+    return EpochSet(rng.randn(len(labels), len(CHANS), 100), labels, np.arange(len(labels)) * 10.0, CHANS), labels
+
+
+def test_epochs_are_sorted_by_label():
+    epoch_set, labels = getEpochSet()
+    np.testing.assert_array_equal(epoch_set.labels, np.sort(labels))
+    # Epochs keep their start times, which are in recording order within each label
+    np.testing.assert_array_equal(epoch_set.start_times, [10, 30, 60, 0, 40, 70, 50, 20])
+    assert epoch_set.data.flags.c_contiguous
+
+def test_select_contiguous_labels_shares_data():
+    epoch_set, labels = getEpochSet()
+    left_right = epoch_set.select(1, 2)
+    np.testing.assert_array_equal(left_right.labels, [1, 1, 1, 2, 2, 2])
+    assert np.shares_memory(left_right.data, epoch_set.data)
+    np.testing.assert_array_equal(left_right.data, epoch_set.data[:6])
+
+    left_foot = epoch_set.select(1, 3)
+    np.testing.assert_array_equal(left_foot.labels, [1, 1, 1, 3])
+    np.testing.assert_array_equal(left_foot.data, epoch_set.data[[0, 1, 2, 6]])
+    assert len(epoch_set.select(5)) == 0
+
+def test_save_and_load(tmp_path):
+    epoch_set, labels = getEpochSet()
+    for filename, mmap_mode in ((str(tmp_path / 'epochs.npz'), None), (str(tmp_path / 'epochs'), 'r')):
+        epoch_set.save(filename)
+        loaded = EpochSet.load(filename, mmap_mode=mmap_mode)
+        np.testing.assert_array_equal(loaded.data, epoch_set.data)
+        np.testing.assert_array_equal(loaded.labels, epoch_set.labels)
+        np.testing.assert_array_equal(loaded.start_times, epoch_set.start_times)
+        assert loaded.chans == CHANS
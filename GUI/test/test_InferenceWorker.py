@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from InferenceWorker import InferenceWorker, DROP_OLDEST, COALESCE, BLOCK
+
+
+@pytest.mark.parametrize('overload_policy', [DROP_OLDEST, COALESCE, BLOCK])
+def test_stop_returns_with_windows_submitted_while_stopping(overload_policy):
+    # A busy worker is stopped from another thread while windows keep arriving
+    release = threading.Event()
+    def predict(window):
+        release.wait()
+        return window
+    worker = InferenceWorker(predict, lambda prediction: None, max_pending=2, overload_policy=overload_policy)
+    worker.start()
+    for i in range(3 if overload_policy == BLOCK else 5):
+        worker.submit(i)
+    stopper = threading.Thread(target=worker.stop)
+    stopper.start()
+    time.sleep(0.05)
+    for i in range(3):
+        worker.submit(i) # Discarded, and never blocks even with BLOCK and a full queue
+    release.set()
+    stopper.join(timeout=5)
+    assert not stopper.is_alive()
+    assert not worker.thread.is_alive()
+
+def test_stop_predicts_the_windows_already_queued():
+    published = []
+    worker = InferenceWorker(lambda window: window, published.append, max_pending=100, overload_policy=BLOCK)
+    worker.start()
+    for i in range(50):
+        worker.submit(i)
+    worker.stop()
+    assert published == list(range(50))
+    # A stopped worker can be started again
+    worker.start()
+    worker.submit(50)
+    worker.stop()
+    assert published[-1] == 50
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import multiprocessing
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from LatencyMonitor import LatencyMonitor, latency_monitor
+
+
+def test_stats_of_recorded_latencies():
+    monitor = LatencyMonitor(history=4)
+    for seconds in (0.001, 0.002, 0.003, 0.004, 0.010):
+        monitor.record('stage', seconds)
+    monitor.increment('samples', 5)
+    stats = monitor.getStats()
+    assert stats['counters'] == {'samples': 5}
+    assert stats['stages']['stage']['count'] == 5
+    # Only the 4 latest latencies are in the rolling window
+    assert stats['stages']['stage']['max_ms'] == pytest.approx(10)
+    assert stats['stages']['stage']['mean_ms'] == pytest.approx(np.mean([10, 2, 3, 4]))
+
+def dumpInChild(filename):
+    latency_monitor.record('child_stage', 0.001)
+    latency_monitor.startDump(filename, interval_seconds=0.05)
+    time.sleep(0.3)
+    latency_monitor.stopDump()
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="fork start method only")
+def test_forked_process_dumps_its_own_stages(tmp_path):
+    filename = str(tmp_path / 'latency.jsonl')
+    latency_monitor.record('parent_stage', 0.001)
+    latency_monitor.startDump(filename, interval_seconds=0.05)
+    try:
+        child = multiprocessing.get_context('fork').Process(target=dumpInChild, args=(filename,))
+        child.start()
+        child.join(timeout=10)
+    finally:
+        latency_monitor.stopDump()
+        latency_monitor.reset()
+    with open(filename) as file:
+        lines = [json.loads(line) for line in file]
+    child_lines = [line for line in lines if line['pid'] == child.pid]
+    assert len(child_lines) > 0 and any(line['pid'] == os.getpid() for line in lines)
+    # The child starts from empty stats rather than a copy of the parent's
+    assert all(set(line['stages']) == {'child_stage'} for line in child_lines)
@@ -0,0 +1,101 @@
+import os
+import sys
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from ModelTrainer import ModelTrainer, trainModel, LOADING, FILTERING, EPOCHING, FEATURES, EVALUATING, SAVING, DONE, FAILED
+
+
+CHANS = ['C4', 'C2', 'C1', 'C3']
+FS = 250
+
+def writeSession(directory, n_trials=20, trial_seconds=5, rest_seconds=2, seed=0):
+    # A recording with alternating left and right trials, the left ones with a stronger 10 Hz rhythm on the left channels
+    rng = np.random.RandomState(seed)
+    n_samples = (n_trials * (trial_seconds + rest_seconds) + rest_seconds) * FS
+    t = np.arange(n_samples) / FS
+    eeg = rng.randn(n_samples, len(CHANS)).cumsum(0)
+    events = []
+    for i in range(n_trials):
+        label = 1 + i % 2
+        start = rest_seconds + i * (trial_seconds + rest_seconds)
+        trial = (t >= start) & (t < start + trial_seconds)
+        eeg[trial, 2:] += (8 if label == 1 else 3) * np.sin(2 * np.pi * 10 * t[trial])[:, np.newaxis]
+        events += [(start, 'start_' + str(label)), (start + trial_seconds, 'end_' + str(label))]
+    eeg_filename = os.path.join(directory, 'eeg_data.csv')
+    event_filename = os.path.join(directory, 'event_data.csv')
+    pd.DataFrame(np.column_stack((t, eeg)), columns=['time'] + CHANS).to_csv(eeg_filename, index=False)
+    pd.DataFrame(events, columns=['time', 'EventStart']).to_csv(event_filename, index=False)
+    return eeg_filename, event_filename
+
+
+def test_trainModel_reports_every_stage_and_saves_the_model(tmp_path):
+    eeg_filename, event_filename = writeSession(str(tmp_path))
+    model_filename = str(tmp_path / 'model.pkl')
+    messages = []
+    model = trainModel(eeg_filename, event_filename, CHANS, model_filename=model_filename,
+                       progress=lambda stage, detail: messages.append((stage, detail)))
+
+    stages = [stage for stage, _ in messages]
+    assert stages[:3] == [LOADING, FILTERING, EPOCHING] and stages[-1] == SAVING
+    # Every model's leave one out progress ends with all 20 folds done
+    evaluated = [detail for stage, detail in messages if stage == EVALUATING]
+    assert {(name, num_done) for name, num_done, num_folds in evaluated if num_done == num_folds} == \
+           {(mod.__name__, 20) for mod in model.mod_types}
+    with open(model_filename, 'rb') as file:
+        saved = pickle.load(file)
+    np.testing.assert_array_equal(saved.feature_indx, model.feature_indx)
+
+def test_trainModel_only_computes_the_stages_whose_inputs_changed(tmp_path):
+    eeg_filename, event_filename = writeSession(str(tmp_path))
+    cache_dir = str(tmp_path / 'cache')
+    def getStages(**kwargs):
+        messages = []
+        model = trainModel(eeg_filename, event_filename, CHANS, cache_dir=cache_dir,
+                           progress=lambda stage, detail: messages.append(stage), **kwargs)
+        return sorted(set(messages)), model
+
+    stages, expected = getStages()
+    assert stages == sorted([LOADING, FILTERING, EPOCHING, FEATURES, EVALUATING])
+    stages, model = getStages()
+    assert stages == []
+    np.testing.assert_array_equal(model.feature_indx, expected.feature_indx)
+    # Only the model depends on num_top
+    stages, model = getStages(num_top=4)
+    assert stages == [EVALUATING]
+    np.testing.assert_array_equal(model.feature_indx, trainModel(eeg_filename, event_filename, CHANS, num_top=4).feature_indx)
+    # A new event file is epoched again from the cached filtered signal
+    events = pd.read_csv(event_filename)
+    events[:-2].to_csv(event_filename, index=False)
+    stages, model = getStages()
+    assert stages == sorted([EPOCHING, FEATURES, EVALUATING])
+
+def test_model_trainer_sends_the_fitted_model(tmp_path):
+    eeg_filename, event_filename = writeSession(str(tmp_path))
+    expected = trainModel(eeg_filename, event_filename, CHANS)
+    trainer = ModelTrainer(eeg_filename, event_filename, CHANS)
+    trainer.start()
+    messages = []
+    deadline = time.time() + 120
+    while not trainer.finished and time.time() < deadline:
+        messages += trainer.poll()
+        time.sleep(0.05)
+    assert messages[-1][0] == DONE
+    model = messages[-1][1]
+    np.testing.assert_array_equal(model.feature_indx, expected.feature_indx)
+    assert model.mod_type is expected.mod_type
+
+def test_model_trainer_reports_errors(tmp_path):
+    trainer = ModelTrainer(str(tmp_path / 'missing.csv'), str(tmp_path / 'missing.csv'), CHANS)
+    trainer.start()
+    messages = []
+    deadline = time.time() + 60
+    while not trainer.finished and time.time() < deadline:
+        messages += trainer.poll()
+        time.sleep(0.05)
+    assert [stage for stage, _ in messages][-1:] == [FAILED]
+    assert 'missing.csv' in messages[-1][1]
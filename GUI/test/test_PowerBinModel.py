@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.model_selection import LeaveOneOut
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from PowerBinModel import PowerBinModel, FAST
+from DataProcessingHelper import getDF
+
+
+CHANS = ['C4', 'C2', 'C1', 'C3']
+
+def getTrials(n_trials=40, n_time=1000, seed=0):
+    # Random walks with a 10 Hz rhythm that is stronger on the left channels for class 1, like motor imagery
+    rng = np.random.RandomState(seed)
+    Y = np.array([1, 2] * (n_trials // 2))
+    t = np.arange(n_time) / 250
+    X = rng.randn(n_trials, len(CHANS), n_time).cumsum(-1)
+    for i, label in enumerate(Y):
+        X[i, 2:] += (8 if label == 1 else 3) * np.sin(2 * np.pi * 10 * t + rng.rand())
+    return X, Y
+
+# The leave one out loop evaluate used to run, refitting the scaler and feature selection on every fold
+def bruteForceLeaveOneOutPredictions(model, X_features, Y):
+    y_preds = []
+    for mod in model.mod_types:
+        y_pred = []
+        for train_ix, test_ix in LeaveOneOut().split(Y):
+            scaler = StandardScaler()
+            X_train_i = scaler.fit_transform(X_features[train_ix])
+            X_train_i, feature_indx = model._selectTopFeatures(X_train_i, Y[train_ix])
+            fold_model = mod()
+            fold_model.fit(X_train_i, Y[train_ix])
+            y_pred.append(fold_model.predict(scaler.transform(X_features[test_ix])[:, feature_indx])[0])
+        y_preds.append(y_pred)
+    return np.array(y_preds)
+
+
+def test_leave_one_out_matches_brute_force():
+    X, Y = getTrials()
+    model = PowerBinModel(CHANS, num_top=8)
+    X_features = model._getFeatureMatrix(X)
+    expected = bruteForceLeaveOneOutPredictions(model, X_features, Y)
+    np.testing.assert_array_equal(model._getLeaveOneOutPredictions(X_features, Y, n_jobs=1), expected)
+    np.testing.assert_array_equal(model._getLeaveOneOutPredictions(X_features, Y), expected)
+
+def test_fast_leave_one_out_matches_brute_force():
+    # LDA folds are exact, the warm started LogisticRegression folds converge to the same predictions here
+    for seed in range(3):
+        X, Y = getTrials(60, seed=seed)
+        model = PowerBinModel(CHANS, num_top=8)
+        X_features = model._getFeatureMatrix(X)
+        expected = bruteForceLeaveOneOutPredictions(model, X_features, Y)
+        np.testing.assert_array_equal(model._getLeaveOneOutPredictions(X_features, Y, loo_method=FAST), expected)
+
+def test_fit_selects_features_on_all_trials():
+    X, Y = getTrials()
+    model = PowerBinModel(CHANS, num_top=8)
+    model.fit(X, Y)
+    X_features = StandardScaler().fit_transform(model._getFeatureMatrix(X))
+    np.testing.assert_array_equal(model.feature_indx, model._selectTopFeatures(X_features, Y)[1])
+    assert model.predict_proba(X).shape == (len(Y), 2)
+
+def test_fit_on_getDF_channel_columns():
+    # Training used to pass the channel columns of getDF, an object array of per-channel epoch arrays
+    X, Y = getTrials()
+    epochs_df = getDF(X, Y, [[i * 10.0, i * 10.0 + 4] for i in range(len(Y))], CHANS)
+    X_object = epochs_df[CHANS].values
+    assert X_object.dtype == object
+    model = PowerBinModel(CHANS, num_top=8)
+    model.fit(X_object, epochs_df['event_type'].values)
+    expected = PowerBinModel(CHANS, num_top=8)
+    expected.fit(X, Y)
+    np.testing.assert_array_equal(model.feature_indx, expected.feature_indx)
+    np.testing.assert_array_equal(model.predict_proba(X_object), expected.predict_proba(X))
+    np.testing.assert_array_equal(model._getFeatures(X_object[0]), expected._getFeatures(X[0]))
+
+def test_compiled_predictions_match_predict_proba():
+    X, Y = getTrials()
+    for mod in PowerBinModel(CHANS).mod_types:
+        model = PowerBinModel(CHANS, num_top=8)
+        model.mod_types = [mod]
+        model.fit(X, Y)
+        X_test, _ = getTrials(10, seed=1)
+        expected = model.predict_proba(X_test)
+        np.testing.assert_allclose([model.predict_proba_one(window) for window in X_test], expected, rtol=1e-9, atol=1e-12)
+
+def test_predict_proba_one_latency_benchmark():
+    X, Y = getTrials()
+    model = PowerBinModel(CHANS, num_top=8)
+    model.fit(X, Y)
+    model.compile()
+    window = getTrials(2, seed=1)[0][0]
+    latencies = []
+    for i in range(200):
+        start = time.perf_counter()
+        model.predict_proba_one(window)
+        latencies.append(time.perf_counter() - start)
+    print("predict_proba_one p50:", np.median(latencies) * 1000, "ms")
+    assert np.median(latencies) < 0.001
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from PredictionSmoother import PredictionSmoother, BOXCAR, EXPONENTIAL
+
+
+def test_boxcar_is_the_mean_of_the_last_window_predictions():
+    values = np.random.RandomState(0).rand(100)
+    smoother = PredictionSmoother(5, BOXCAR, initial_value=0.5)
+    history = [0.5] * 5 # The window starts out filled with the initial value
+    for value in values:
+        history.append(value)
+        assert smoother.update(value) == pytest.approx(np.mean(history[-5:]), abs=1e-12)
+
+def test_exponential_matches_a_reference_loop():
+    values = np.random.RandomState(1).rand(100)
+    smoother = PredictionSmoother(4, EXPONENTIAL, initial_value=0.5)
+    alpha = 2 / (4 + 1)
+    expected = 0.5
+    for value in values:
+        expected = alpha * value + (1 - alpha) * expected
+        assert smoother.update(value) == pytest.approx(expected, abs=1e-12)
+
+def test_boxcar_resyncs_its_running_sum_once_per_window():
+    # A huge prediction leaves rounding error in the running sum until the window has passed it
+    smoother = PredictionSmoother(3, BOXCAR)
+    for value in [1e17, 0.1, 0.2]:
+        smoother.update(value)
+    for value in [0.3, 0.4, 0.5]:
+        smoother.update(value)
+    assert smoother.index == 0
+    assert smoother.total == np.sum([0.3, 0.4, 0.5])
+    assert smoother.getValue() == np.sum([0.3, 0.4, 0.5]) / 3
+
+def test_switching_kernels_mid_stream():
+    values = np.random.RandomState(2).rand(20)
+    references = {kernel: PredictionSmoother(4, kernel) for kernel in (BOXCAR, EXPONENTIAL)}
+    switching = PredictionSmoother(4, BOXCAR)
+    for i, value in enumerate(values):
+        # Both kernels are always kept up to date, so a switch gives the other kernel's value without a warm up
+        kernel = EXPONENTIAL if (i // 5) % 2 else BOXCAR
+        switching.setKernel(kernel)
+        for reference in references.values():
+            reference.update(value)
+        assert switching.update(value) == references[kernel].getValue()
+    switching.setKernel(BOXCAR)
+    assert switching.getValue() == references[BOXCAR].getValue()
+    with pytest.raises(ValueError):
+        switching.setKernel('gaussian')
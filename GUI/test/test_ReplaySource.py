@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from ReplaySource import ReplaySource
+from EEGRecorder import EEGRecorder
+from CSVWriter import CSVWriter
+
+
+FS = 250
+CHANNELS = [4, 5, 6, 7]
+NUM_BOARD_CHANNELS = 8
+
+def writeRecording(directory, n_samples, columns=CHANNELS, seed=0):
+    # A recording with one sample every 1/FS seconds, as EEGRecorder writes it but with exact timestamps
+    samples = np.random.RandomState(seed).randn(n_samples, len(columns))
+    eeg_filename = os.path.join(directory, 'eeg_data.csv')
+    pd.DataFrame(np.column_stack((np.arange(n_samples) / FS, samples)), columns=['timestamp'] + list(columns)).to_csv(eeg_filename, index=False)
+    return eeg_filename, samples
+
+def replay(replay_source):
+    blocks = []
+    replay_source.run(lambda block: blocks.append(block.copy()))
+    return blocks
+
+
+def test_blocks_cover_the_recording_and_end_with_a_short_block(tmp_path):
+    eeg_filename, samples = writeRecording(str(tmp_path), 25)
+    blocks = replay(ReplaySource(eeg_filename, channels=CHANNELS, speed=None, block_size=10))
+    assert [len(block) for block in blocks] == [10, 10, 5]
+    # Blocks hold all the board channels, with the recorded ones in place
+    assert all(block.shape[1] == NUM_BOARD_CHANNELS for block in blocks)
+    np.testing.assert_allclose(np.concatenate(blocks)[:, CHANNELS], samples)
+
+def test_channels_recorded_by_EEGRecorder_are_mapped_back_to_their_board_channels(tmp_path):
+    eeg_filename = str(tmp_path / 'eeg_data.csv')
+    recorder = EEGRecorder(False, eeg_filename, channels=[6, 1])
+    # What start() sets up for a live recording
+    recorder.csv_writer = CSVWriter(eeg_filename, column_headers=["timestamp"] + recorder.channels)
+    board_samples = np.random.RandomState(1).randn(12, NUM_BOARD_CHANNELS)
+    for sample in board_samples:
+        recorder.record_data_sample(sample)
+
+    # The channels given to the replay don't matter when the header names the board channels
+    replayed = np.concatenate(replay(ReplaySource(eeg_filename, channels=CHANNELS, speed=None, block_size=5)))
+    assert replayed.shape == (12, NUM_BOARD_CHANNELS)
+    np.testing.assert_allclose(replayed[:, [6, 1]], board_samples[:, [6, 1]])
+    assert not np.any(replayed[:, [0, 2, 3, 4, 5, 7]])
+
+def test_unnamed_columns_are_the_given_channels_in_order(tmp_path):
+    eeg_filename, samples = writeRecording(str(tmp_path), 10, columns=['C4', 'C2', 'C1', 'C3'])
+    replayed = np.concatenate(replay(ReplaySource(eeg_filename, channels=CHANNELS, speed=None)))
+    np.testing.assert_allclose(replayed[:, CHANNELS], samples)
+
+def test_speed_follows_the_recorded_timestamps(tmp_path):
+    eeg_filename, _ = writeRecording(str(tmp_path), 101) # 0.4 seconds of timestamps
+    recorded_seconds = 100 / FS
+    for speed in (1, 4):
+        replay_source = ReplaySource(eeg_filename, channels=CHANNELS, speed=speed)
+        start = time.perf_counter()
+        replay(replay_source)
+        elapsed = time.perf_counter() - start
+        assert recorded_seconds / speed <= elapsed < recorded_seconds / speed + 0.2
+
+    # As fast as possible finishes well before the recording would have
+    replay_source = ReplaySource(eeg_filename, channels=CHANNELS, speed=None)
+    start = time.perf_counter()
+    replay(replay_source)
+    assert time.perf_counter() - start < recorded_seconds / 4
+
+def test_throughput_of_the_last_replay(tmp_path):
+    eeg_filename, _ = writeRecording(str(tmp_path), 100)
+    replay_source = ReplaySource(eeg_filename, channels=CHANNELS, speed=2)
+    assert replay_source.getThroughput() == {'samples_per_second': 0, 'realtime_factor': 0}
+    replay(replay_source)
+    throughput = replay_source.getThroughput()
+    assert replay_source.num_samples_replayed == 100
+    assert throughput['samples_per_second'] == 100 / replay_source.elapsed_seconds
+    assert throughput['realtime_factor'] == throughput['samples_per_second'] / FS
+    # Paced at twice real time, give or take the first sample that is sent without waiting
+    assert 1.5 < throughput['realtime_factor'] < 2.1
+
+def test_events_are_sent_with_the_sample_they_happened_at(tmp_path):
+    eeg_filename, _ = writeRecording(str(tmp_path), 50)
+    event_filename = str(tmp_path / 'event_data.csv')
+    # The second event falls between samples 25 and 26, so it is at the next sample
+    pd.DataFrame([(0.0, 'start_1'), (25 / FS, 'end_1'), (25.5 / FS, 'start_2'), (49 / FS, 'end_2')],
+                 columns=['timestamp', 'event']).to_csv(event_filename, index=False)
+    replay_source = ReplaySource(eeg_filename, event_filename, channels=CHANNELS, speed=None, block_size=10)
+    assert [(int(index), event) for index, event in replay_source.events] == \
+           [(0, 'start_1'), (25, 'end_1'), (26, 'start_2'), (49, 'end_2')]
+
+    num_replayed = [0]
+    received = []
+    def callback(block):
+        num_replayed[0] += len(block)
+    def event_callback(event, sample_index):
+        received.append((event, sample_index, num_replayed[0]))
+    replay_source.run(callback, event_callback)
+    # Every event is sent right after the block holding its sample
+    assert [(event, index) for event, index, _ in received] == \
+           [('start_1', 0), ('end_1', 25), ('start_2', 26), ('end_2', 49)]
+    assert [replayed for _, _, replayed in received] == [10, 30, 30, 50]
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from RingBuffer import RingBuffer
+
+
+# The np.roll buffer the RingBuffer replaced, newest sample first
+def rollAppend(reference, sample):
+    reference = np.roll(reference, 1, axis=0)
+    reference[0] = sample
+    return reference
+
+def test_latest_matches_np_roll_buffer():
+    rng = np.random.RandomState(0)
+    capacity, n_chans = 50, 3
+    ring = RingBuffer(capacity, (n_chans,))
+    reference = np.zeros((capacity, n_chans))
+    num_samples = 0
+    # Single samples and blocks smaller than, equal to and larger than the capacity, wrapping many times
+    for size in rng.choice([1, 2, 7, 49, 50, 51, 120], size=200):
+        samples = rng.randn(size, n_chans)
+        if size == 1 and rng.rand() < 0.5:
+            ring.append(samples[0])
+        else :
+            ring.extend(samples)
+        for sample in samples:
+            reference = rollAppend(reference, sample)
+        num_samples += size
+        n = rng.randint(1, capacity + 1)
+        np.testing.assert_array_equal(ring.getLatest(n), reference[:n])
+        np.testing.assert_array_equal(ring.getLatest(), reference)
+        np.testing.assert_array_equal(ring.getNewest(), reference[0])
+        assert ring.count == num_samples
+
+def test_setLatest_keeps_the_mirror_in_sync():
+    rng = np.random.RandomState(1)
+    capacity = 20
+    ring = RingBuffer(capacity)
+    reference = np.zeros(capacity)
+    for size in rng.randint(1, 30, size=100):
+        ring.extend(rng.randn(size))
+        reference = ring.getLatest().copy()
+        # Overwrite the newest samples across the wrap around, then check every view of the buffer
+        n = rng.randint(1, capacity + 1)
+        values = rng.randn(n)
+        ring.setLatest(values)
+        reference[:n] = values
+        np.testing.assert_array_equal(ring.getLatest(), reference)
+        ring.append(0.0)
+        np.testing.assert_array_equal(ring.getLatest(), np.concatenate(([0.0], reference[:-1])))
+
+def test_latest_is_read_only_and_bounded():
+    ring = RingBuffer(10)
+    ring.extend(np.arange(5.0))
+    with pytest.raises(ValueError):
+        ring.getLatest()[0] = 1
+    with pytest.raises(ValueError):
+        ring.getLatest(11)
@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from SamplerMemory import SamplerMemory, SNAPSHOT_TIMEOUT_SECONDS
+
+
+N_CHANS = 2
+
+# Write a block of samples the way EEGSampler does, with the sequence odd while the buffers change
+def writeBlock(memory, samples, prediction=0.0):
+    memory.sequence += 1
+    memory.buffer.extend(samples)
+    memory.pred_values.extend(np.full(len(samples), prediction))
+    memory.pred_values_average.extend(np.full(len(samples), prediction))
+    memory.sequence += 1
+
+def getSamples(start, n):
+    return np.arange(start, start + n, dtype=float)[:, np.newaxis] * np.ones(N_CHANS)
+
+
+def test_snapshot_is_oldest_first_with_sample_indices():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 25), prediction=0.5)
+    snapshot = memory.getSnapshot(4)
+    np.testing.assert_array_equal(snapshot.eeg, getSamples(21, 4))
+    np.testing.assert_array_equal(snapshot.sample_indices, [21, 22, 23, 24])
+    np.testing.assert_array_equal(snapshot.predictions, [0.5] * 4)
+    np.testing.assert_array_equal(memory.getSnapshot().sample_indices, np.arange(15, 25))
+
+def test_snapshot_arrays_are_read_only():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 10))
+    snapshot = memory.getSnapshot()
+    for array in snapshot:
+        with pytest.raises(ValueError):
+            array[0] = 1
+
+def test_snapshot_is_cached_until_the_sequence_changes():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 10))
+    snapshot = memory.getSnapshot(5)
+    assert memory.getSnapshot(5) is snapshot
+    assert memory.getSnapshot(6) is not snapshot
+    writeBlock(memory, getSamples(10, 1))
+    new_snapshot = memory.getSnapshot(6)
+    assert new_snapshot is not snapshot
+    np.testing.assert_array_equal(new_snapshot.sample_indices, np.arange(5, 11))
+
+def test_snapshot_retries_a_read_torn_by_the_writer():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 10))
+    # A whole block is written while the reader copies the samples, the first copy must be thrown away
+    get_latest = memory.buffer.getLatest
+    num_reads = []
+    def tornGetLatest(n=None):
+        num_reads.append(n)
+        if len(num_reads) == 1:
+            writeBlock(memory, getSamples(10, 3), prediction=1.0)
+        return get_latest(n)
+    memory.buffer.getLatest = tornGetLatest
+    snapshot = memory.getSnapshot(5)
+    assert len(num_reads) == 2
+    np.testing.assert_array_equal(snapshot.eeg, getSamples(8, 5))
+    np.testing.assert_array_equal(snapshot.sample_indices, np.arange(8, 13))
+    np.testing.assert_array_equal(snapshot.predictions, [0, 0, 1, 1, 1])
+
+def test_snapshot_waits_for_the_writer_to_finish_a_block():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 10))
+    memory.sequence += 1 # The writer is midway through a block
+    def finishBlock():
+        time.sleep(SNAPSHOT_TIMEOUT_SECONDS / 4)
+        memory.buffer.extend(getSamples(10, 2))
+        memory.pred_values.extend(np.zeros(2))
+        memory.pred_values_average.extend(np.zeros(2))
+        memory.sequence += 1
+    writer = threading.Thread(target=finishBlock)
+    writer.start()
+    snapshot = memory.getSnapshot(3)
+    writer.join()
+    np.testing.assert_array_equal(snapshot.sample_indices, [9, 10, 11])
+    np.testing.assert_array_equal(snapshot.eeg, getSamples(9, 3))
+
+def test_snapshot_gives_up_on_a_writer_that_never_finishes():
+    memory = SamplerMemory(10, N_CHANS)
+    writeBlock(memory, getSamples(0, 10))
+    memory.sequence += 1 # The writer died midway through a block
+    # Without a previous snapshot, the samples are copied as they are
+    np.testing.assert_array_equal(memory.getSnapshot(3).sample_indices, [7, 8, 9])
+    memory.sequence += 1
+    snapshot = memory.getSnapshot(3)
+    memory.sequence += 1
+    memory.buffer.extend(getSamples(10, 2))
+    start = time.perf_counter()
+    assert memory.getSnapshot(3) is snapshot
+    assert time.perf_counter() - start < 10 * SNAPSHOT_TIMEOUT_SECONDS
+
+def test_shared_memory_is_read_by_name():
+    memory = SamplerMemory(10, N_CHANS, shared=True)
+    reader = SamplerMemory(10, N_CHANS, shared=True, name=memory.name, read_only=True)
+    try:
+        writeBlock(memory, getSamples(0, 12))
+        np.testing.assert_array_equal(reader.getSnapshot(4).eeg, getSamples(8, 4))
+        with pytest.raises(ValueError):
+            reader.sequence = 0
+    finally:
+        reader.close()
+        memory.close()
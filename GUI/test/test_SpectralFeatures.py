@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pyeeg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from SpectralFeatures import getBinPowers, getPowerRatios, getHjorth, SlidingSpectrum
+
+
+FS = 250
+BINNING = [1, 4, 7, 12, 30]
+
+def test_power_ratios_match_pyeeg():
+    # Odd lengths and bands past Nyquist take the negative frequency half of pyeeg's full FFT
+    for n_time, binning in ((1000, BINNING), (999, BINNING), (64, [1, 50, 100, 200])):
+        eeg_datas = np.random.RandomState(n_time).randn(3, 2, n_time).cumsum(-1)
+        powers = getBinPowers(eeg_datas, binning, FS)
+        ratios = getPowerRatios(eeg_datas, binning, FS)
+        for i, j in np.ndindex(*eeg_datas.shape[:2]):
+            expected_power, expected_ratio = pyeeg.bin_power(eeg_datas[i, j], binning, FS)
+            np.testing.assert_allclose(powers[i, j], expected_power, rtol=1e-10)
+            np.testing.assert_allclose(ratios[i, j], expected_ratio, rtol=1e-10)
+
+def test_hjorth_matches_pyeeg():
+    eeg_datas = np.random.RandomState(0).randn(3, 4, 500).cumsum(-1)
+    mobilities, complexities = getHjorth(eeg_datas)
+    for i, j in np.ndindex(*eeg_datas.shape[:2]):
+        mobility, complexity = pyeeg.hjorth(eeg_datas[i, j])
+        np.testing.assert_allclose(mobilities[i, j], mobility, rtol=1e-10)
+        np.testing.assert_allclose(complexities[i, j], complexity, rtol=1e-10)
+
+def test_sliding_spectrum_matches_full_computation():
+    stream = np.random.RandomState(1).randn(4, 8000).cumsum(-1)
+    n_time = 1000
+    # Regular hops, a skipped hop, a repeated window, a jump back and a jump past the window length
+    window_ends = list(range(n_time - 1, 4000, 25)) + [4050, 4050, 3000, 6500, 6510]
+    for newest_first in (False, True):
+        spectrum = SlidingSpectrum(n_time, BINNING, FS, newest_first=newest_first)
+        for window_end in window_ends:
+            window = stream[:, window_end - n_time + 1:window_end + 1]
+            if newest_first:
+                window = window[:, ::-1]
+            ratios, mobilities, complexities = spectrum.update(window, window_end)
+            expected_mobilities, expected_complexities = getHjorth(window)
+            np.testing.assert_allclose(ratios, getPowerRatios(window, BINNING, FS), rtol=1e-9)
+            np.testing.assert_allclose(mobilities, expected_mobilities, rtol=1e-9)
+            np.testing.assert_allclose(complexities, expected_complexities, rtol=1e-9)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from StageCache import StageCache
+
+
+def test_cached_stage_is_not_computed_again(tmp_path):
+    calls = []
+    def compute():
+        calls.append(1)
+        return {'value': len(calls)}
+
+    cache = StageCache(str(tmp_path))
+    key = cache.getKey('stage', 'input', (1, 50))
+    assert cache.getOrCompute('stage', key, compute) == {'value': 1}
+    # Also from a new cache on the same directory, e.g. the next training run
+    assert StageCache(str(tmp_path)).getOrCompute('stage', key, compute) == {'value': 1}
+    assert len(calls) == 1
+    assert cache.getOrCompute('stage', cache.getKey('stage', 'input', (1, 40)), compute) == {'value': 2}
+
+def test_file_hash_follows_the_contents(tmp_path):
+    filename = str(tmp_path / 'data.csv')
+    with open(filename, 'w') as file:
+        file.write("time,C4\n0,1\n")
+    cache = StageCache(None)
+    file_hash = cache.getFileHash(filename)
+    assert StageCache(None).getFileHash(filename) == file_hash
+    with open(filename, 'w') as file:
+        file.write("time,C4\n0,2\n")
+    assert cache.getFileHash(filename) != file_hash
+
+def test_no_directory_always_computes():
+    cache = StageCache(None)
+    values = iter(range(2))
+    key = cache.getKey('stage')
+    assert [cache.getOrCompute('stage', key, lambda: next(values)) for _ in range(2)] == [0, 1]
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+from scipy.signal import sosfilt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from StreamingFilter import StreamingFilter
+
+
+def getBlocks(signal, seed=0):
+    # Uneven blocks, from single samples to more than a second of data
+    rng = np.random.RandomState(seed)
+    bounds = np.cumsum(rng.choice([1, 3, 10, 33, 250, 500], size=len(signal)))
+    bounds = np.concatenate(([0], bounds[bounds < len(signal)], [len(signal)]))
+    return [signal[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+def test_blocks_match_one_call_over_the_whole_signal():
+    signal = np.random.RandomState(0).randn(5000, 4).cumsum(0)
+    expected = StreamingFilter(4).process(signal)
+    np.testing.assert_allclose(expected, sosfilt(StreamingFilter(4).sos, signal, axis=0), rtol=1e-12, atol=1e-12)
+
+    streaming_filter = StreamingFilter(4)
+    filtered = np.concatenate([streaming_filter.process(block) for block in getBlocks(signal)])
+    np.testing.assert_allclose(filtered, expected, rtol=1e-10, atol=1e-10)
+
+def test_reset_starts_over():
+    signal = np.random.RandomState(1).randn(1000, 2)
+    streaming_filter = StreamingFilter(2)
+    first = streaming_filter.process(signal)
+    streaming_filter.reset()
+    np.testing.assert_array_equal(streaming_filter.process(signal), first)
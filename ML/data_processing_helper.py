@@ -1,47 +1,54 @@
 import pandas as pd
 import numpy as np
-from neurodsp import filt
+from neurodsp.filt.fir import design_fir_filter
 import random
 import matplotlib.pyplot as plt
 import scipy.signal as signal # For filtering
 from neurodsp.spectral import compute_spectrum # for smoothed PSD computation
+from functools import lru_cache
 
 
 eeg_fs = 250 # Data was recorded at 250 Hz
+FILTER_CACHE_SIZE = 32 # Number of filter designs kept, least recently used designs are dropped first
+
+# Design a filter once per set of parameters: a butterworth sos for 'iir' or FIR coefficients for 'fir'
+def getFilterDesign(fs, band, order=2, filter_type='iir', pass_type='bandpass', n_seconds=None):
+    return _designFilter(fs, tuple(band), order, filter_type, pass_type, n_seconds)
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _designFilter(fs, band, order, filter_type, pass_type, n_seconds):
+    if filter_type == 'iir':
+        design = signal.butter(order, band, btype=pass_type, output='sos', fs=fs)
+    else :
+        design = design_fir_filter(fs, pass_type, band, n_seconds=n_seconds)
+    return design # Shared by every caller, so it must not be modified
+
+# Zero-phase FIR bandstop (1 second long by default) that keeps the shape of sig, the edges are filtered as if sig was zero padded
+# Gives the same attenuation as filt.filter_signal(sig, fs, 'bandstop', band, n_seconds=1) without its NaN edges
+def notchFilter(sig, fs=eeg_fs, band=(58, 62), n_seconds=1, axis=-1):
+    sig = np.asarray(sig)
+    kernel = getFilterDesign(fs, band, filter_type='fir', pass_type='bandstop', n_seconds=n_seconds)
+    # Lay the kernel along the time axis so every other axis is filtered in the same call
+    kernel_shape = [1] * sig.ndim
+    kernel_shape[axis] = len(kernel)
+    return signal.convolve(sig, kernel.reshape(kernel_shape), mode='same')
 
 # Filter eeg // does perform well on short signals, possibly because of padding
-def filterEEG(eeg_data, fs=eeg_fs, f_range=(1, 50)):
-    sig_filt = filt.filter_signal(eeg_data, fs, 'bandpass', f_range, filter_type='iir', butterworth_order=2)
-    test_sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
-    num_nans = sum(np.isnan(test_sig_filt))
-    sig_filt = np.concatenate(([0]*(num_nans // 2), sig_filt, [0]*(num_nans // 2)))
-    sig_filt = filt.filter_signal(sig_filt, fs, 'bandstop', (58, 62), n_seconds=1)
-    sig_filt = sig_filt[~np.isnan(sig_filt)]
-    return sig_filt
+# eeg_data can have any number of dimensions, e.g. (#channels, #timepoints) with axis=-1 or (#timepoints, #channels) with axis=0
+def filterEEG(eeg_data, fs=eeg_fs, f_range=(1, 50), axis=-1):
+    sig_filt = signal.sosfiltfilt(getFilterDesign(fs, f_range), eeg_data, axis=axis)
+    return notchFilter(sig_filt, fs, axis=axis)
 
-from scipy.signal import butter, sosfiltfilt, sosfreqz  # for filtering
-def bandpass_bandstop_filter(data,fs=eeg_fs, lowcut=1, highcut=50, order = 2):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    sos = butter(order, [low, high], analog = False, btype = 'band', output = 'sos')
-    filted_data = sosfiltfilt(sos, data)
-    filted_data = filt.filter_signal(filted_data, fs, 'bandstop', (58, 62), n_seconds=1)
-    filted_data = filted_data[~np.isnan(filted_data)]
-    return filted_data
+from scipy.signal import sosfiltfilt  # for filtering
+def bandpass_bandstop_filter(data,fs=eeg_fs, lowcut=1, highcut=50, order = 2, axis=-1):
+    sos = getFilterDesign(fs, (lowcut, highcut), order)
+    filted_data = sosfiltfilt(sos, data, axis=axis)
+    return notchFilter(filted_data, fs, axis=axis)
 
 # Filter a whole set of eeg epochs 
 def getFilteredEpochs(eeg_epochs):
-    # eeg_epochs is in (#trials, #timepoints, #channels)
-    filtered_eeg_epochs = []
-    for eeg_epoch in eeg_epochs: 
-        filtered_epoch = []
-        for i in range(len(eeg_epoch)):  
-            filtered_eeg = bandpass_bandstop_filter(eeg_epoch[i])
-            filtered_epoch.append(filtered_eeg)
-        filtered_epoch = np.array(filtered_epoch)
-        filtered_eeg_epochs.append(filtered_epoch)
-    return np.array(filtered_eeg_epochs)
+    # eeg_epochs is in (#trials, #channels, #timepoints), all of them are filtered along time at once
+    return bandpass_bandstop_filter(np.asarray(eeg_epochs), axis=-1)
 
 
 ## Create DF for each of these, columns are channels, each row is a trial run
@@ -18,7 +18,9 @@ def generate_epoch(file_path, channels, fs, eeg_filter, stimulus_times = None, b
     :file_path (String): path to your csv file
     :channels ([String]): array of channels to epoch
     :fs (float): sampling rate
-    :eeg_filter (function): the filter you want to apply to raw eeg data
+    :eeg_filter (function): the filter you want to apply to raw eeg data, called with (#channels, #timepoints) data.
+        A filter that only takes a single channel, e.g. one that drops NaN edges and so flattens 2d input,
+        is applied to each channel in turn instead
     :stimulus_times ([float], optional): The time points that stimulus occur
     :baseline (boolean, optional): whether you want to apply baseline correction after epoching
     :epoch_s (int, optional): epoch starting time relative to stmulus in miliseconds
@@ -46,32 +48,23 @@ def generate_epoch(file_path, channels, fs, eeg_filter, stimulus_times = None, b
     # Define the bounds of our epoch as well as our baseline
     b_s = int((abs(epoch_s) + bl_s) * (fs / 1000)) # index in epoch_df where our baseline begins
     b_e = int((abs(epoch_s) + bl_e) * (fs / 1000)) # index in epoch_df where our baseline ends
-    # Let's calculate the length our epoch with our given sampling rate
-    epoch_len = int((abs(epoch_s) + abs(epoch_e)) * (fs / 1000))
-
     # Let's define some helpful variables to make our extraction easier
     e_s = int((epoch_s * (fs / 1000))) # effectively the number of indices before marker we want
     e_e = int((epoch_e * (fs / 1000))) # effectively the number of indices after marker we want
 
-    # Epoch the data
-    final_epoch = np.empty((mark_indices.shape[0], epoch_len, 0), float)
-    for channel in channels:
-        epoch = np.zeros(shape = (int(mark_indices.shape[0]), epoch_len))
-        raw_eeg = train_data[channel].values
-
-        ################# You may want to apply your own filter ################
-        clean_eeg = eeg_filter(raw_eeg, fs, 1.0, 40.0, 5)
-        ########################################################################
-
-        for i, mark_idx in enumerate(mark_indices):
-            epoch[i, :] = clean_eeg[mark_idx + e_s : mark_idx + e_e] # grab the appropriate samples around the stimulus onset
+    # Filter all the channels at once, eeg_filter filters along the last axis of raw_eeg (#channels, #timepoints)
+    ################# You may want to apply your own filter ################
+    clean_eeg = eeg_filter(raw_eeg, fs, 1.0, 40.0, 5)
+    if np.ndim(clean_eeg) != 2 or len(clean_eeg) != len(raw_eeg):
+        # A single channel filter mixed the channels up, filter them one at a time like before
+        clean_eeg = np.apply_along_axis(eeg_filter, 1, raw_eeg, fs, 1.0, 40.0, 5)
+    ########################################################################
 
-        # Baseline correction
-        if baseline:
-            for i in range(0, int(epoch.shape[0])):
-                epoch[i, :] = epoch[i, :] - np.mean(epoch[i, b_s:b_e])
+    # Epoch the data, grabbing the appropriate samples around every stimulus onset at once
+    epoch_indices = mark_indices[:, np.newaxis] + np.arange(e_s, e_e)
+    final_epoch = np.swapaxes(clean_eeg[:, epoch_indices], 0, 1) # (stimuli, channels, time points)
 
-        # stack epoch of each channel
-        final_epoch = np.dstack((final_epoch, epoch))
-    final_epoch = np.swapaxes(final_epoch, 1, 2)
+    # Baseline correction
+    if baseline:
+        final_epoch = final_epoch - np.mean(final_epoch[:, :, b_s:b_e], axis=2, keepdims=True)
     return final_epoch
\ No newline at end of file